@@ -1,142 +1,312 @@
 # -*- coding: utf-8 -*-
 import sys
+import time
+# 启动计时从导入 PyQt5 之前开始
+STARTUP_BEGIN = time.perf_counter()
 import os
-import re
 import json
-import requests
-import urllib.parse
-from pathlib import Path
+import threading
+from pathlib import Path, PurePosixPath
+from collections import Counter
 from PyQt5.QtWidgets import QFileDialog
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QLabel, QLineEdit, QComboBox, QListWidget, QPushButton,
-    QDateEdit, QTextEdit, QMessageBox, QProgressBar, QGroupBox,
-    QSizePolicy, QSplitter, QFrame
+    QLabel, QLineEdit, QComboBox, QListWidget, QListWidgetItem, QPushButton,
+    QDateEdit, QPlainTextEdit, QMessageBox, QProgressBar, QGroupBox,
+    QSizePolicy, QSplitter, QFrame, QSpinBox, QCheckBox
 )
-from PyQt5.QtCore import Qt, QDate, QThread, pyqtSignal
-from PyQt5.QtGui import QDragEnterEvent, QDropEvent, QFont, QFontDatabase
-import qdarkstyle
+from PyQt5.QtCore import Qt, QDate, QThread, QObject, QTimer, pyqtSignal
+from PyQt5.QtGui import QDragEnterEvent, QDropEvent, QFont, QFontDatabase, QColor, QPalette
+from yuque_core import (
+    DEFAULT_OPTIMIZE_OPTIONS, DirectoryWatcher, ImageCache, PostConverter, PostManifest, RunReport, SearchIndex,
+    TaxonomyIndex, YuqueArchive, YuqueClient, YuqueSync, create_optimize_pool, localize_pending_posts,
+    retry_failed_posts
+)
+STARTUP_IMPORTED = time.perf_counter()
+
+# 日志与进度每隔多少毫秒批量刷新一次，日志最多保留的行数
+LOG_FLUSH_INTERVAL_MS = 200
+LOG_MAX_LINES = 5000
+# 通过语雀 OpenAPI 同步下来的文档正文保存目录
+SYNC_DIR = Path("yuque_sync")
+# qdarkstyle 编译出的样式表缓存，启动时直接应用，不必等待 qdarkstyle 重新生成
+STYLE_CACHE = Path("stylesheet_cache.json")
+STARTUP_LOG = Path("run_reports") / "startup.jsonl"
+
+# 叠加在 qdarkstyle 之上的界面样式
+APP_STYLESHEET = """
+    QGroupBox {
+        border: 1px solid #444;
+        border-radius: 5px;
+        margin-top: 10px;
+        padding-top: 15px;
+    }
+    QGroupBox::title {
+        subcontrol-origin: margin;
+        left: 10px;
+        padding: 0 3px;
+    }
+    QLabel {
+        padding: 5px 0;
+    }
+    QLineEdit, QDateEdit, QComboBox {
+        padding: 5px;
+        border: 1px solid #444;
+        border-radius: 4px;
+        background: #2B2B2B;
+    }
+    QSplitter::handle {
+        background: #444;
+        height: 5px;
+    }
+"""
 
 
 class DownloadThread(QThread):
     progress = pyqtSignal(str, int)
     finished = pyqtSignal(bool)
 
-    def __init__(self, md_path, front_matter, output_root, image_url_prefix):
+    def __init__(self, md_path, front_matter, output_root, image_url_prefix, max_workers=8, cache=None,
+                 incremental=True, optimize_options=None, run_report=None, archive=None, shared_assets=False,
+                 search_index=False, lazy_images=False, optimize_pool=None):
+        super().__init__()
+        self.converter = PostConverter(md_path, front_matter, output_root, image_url_prefix, max_workers,
+                                       cache, incremental, progress=self.progress.emit,
+                                       optimize_options=optimize_options, run_report=run_report,
+                                       archive=archive, shared_assets=shared_assets, search_index=search_index,
+                                       lazy_images=lazy_images, optimize_pool=optimize_pool)
+
+    def run(self):
+        self.finished.emit(self.converter.convert())
+
+    def cancel(self):
+        self.converter.cancel()
+
+
+class RetryFailedThread(QThread):
+    """仅重试失败日志中的图片，并修正已写出的文章"""
+    progress = pyqtSignal(str, int)
+    finished = pyqtSignal(int)
+
+    def __init__(self, output_root, image_url_prefix, max_workers=8, cache=None, run_report=None,
+                 shared_assets=False):
         super().__init__()
-        self.md_path = md_path
-        self.front_matter = front_matter
         self.output_root = output_root
         self.image_url_prefix = image_url_prefix
+        self.max_workers = max_workers
+        self.cache = cache
+        self.run_report = run_report
+        self.shared_assets = shared_assets
+
+    def run(self):
+        remaining = retry_failed_posts(self.output_root, self.image_url_prefix, self.max_workers, self.cache,
+                                       progress=self.progress.emit, run_report=self.run_report,
+                                       shared_assets=self.shared_assets)
+        self.finished.emit(remaining)
+
+
+class LocalizeThread(QThread):
+    """按队列顺序下载先写出文章的图片并更新文章，可取消，未完成的部分下次继续"""
+    progress = pyqtSignal(str, int)
+    finished = pyqtSignal(int)
+
+    def __init__(self, output_root, image_url_prefix, max_workers=8, cache=None, run_report=None,
+                 shared_assets=False, optimize_options=None, optimize_pool=None):
+        super().__init__()
+        self.output_root = output_root
+        self.image_url_prefix = image_url_prefix
+        self.max_workers = max_workers
+        self.cache = cache
+        self.run_report = run_report
+        self.shared_assets = shared_assets
+        self.optimize_options = optimize_options
+        self.optimize_pool = optimize_pool
+        self.cancelled = threading.Event()
+
+    def run(self):
+        remaining = localize_pending_posts(self.output_root, self.image_url_prefix, self.max_workers, self.cache,
+                                           progress=self.progress.emit, run_report=self.run_report,
+                                           shared_assets=self.shared_assets, cancelled=self.cancelled,
+                                           optimize_options=self.optimize_options, optimize_pool=self.optimize_pool)
+        self.finished.emit(remaining)
+
+    def cancel(self):
+        self.cancelled.set()
+
+
+class TaxonomyThread(QThread):
+    """在后台刷新博客的分类/标签索引，避免大博客阻塞界面"""
+    loaded = pyqtSignal(object, object)
+
+    def __init__(self, output_root):
+        super().__init__()
+        self.output_root = output_root
+
+    def run(self):
+        try:
+            index = TaxonomyIndex.for_posts_dir(Path(self.output_root) / "source" / "_posts")
+            categories, tags = index.refresh()
+        except Exception:
+            categories, tags = Counter(), Counter()
+        self.loaded.emit(categories, tags)
+
+
+class WatchThread(QThread):
+    """在后台轮询监视文件夹，文件写入完成（一段时间内不再变化）后发出 file_ready"""
+    file_ready = pyqtSignal(str)
+
+    def __init__(self, directory):
+        super().__init__()
+        self.watcher = DirectoryWatcher([directory])
 
-    def safe_filename(self, filename):
-        filename = urllib.parse.unquote(filename)
-        filename = os.path.basename(filename).split('?')[0]
-        return re.sub(r'[\\/*?:"<>|]', '_', filename)
+    def run(self):
+        self.watcher.run(self.file_ready.emit)
 
-    def get_unique_path(self, directory, filename):
-        counter = 1
-        name, ext = os.path.splitext(filename)
-        while (directory / filename).exists():
-            filename = f"{name}_{counter}{ext}"
-            counter += 1
-        return directory / filename
+    def stop(self):
+        self.watcher.stop()
 
-    def is_valid_url(self, url):
-        """检查 URL 是否有效（包含协议头）"""
-        return url.startswith(('http://', 'https://'))
+
+class SyncThread(QThread):
+    """通过语雀 OpenAPI 同步知识库，完成后发出 [(md 路径, 标题和日期)]，失败时发出 None"""
+    progress = pyqtSignal(str, int)
+    finished = pyqtSignal(object)
+
+    def __init__(self, namespace, token, max_workers=8, run_report=None):
+        super().__init__()
+        self.namespace = namespace
+        self.token = token
+        self.max_workers = max_workers
+        self.run_report = run_report
 
     def run(self):
+        client = YuqueClient(self.token, max_workers=self.max_workers)
         try:
-            original_path = Path(self.md_path)
-            folder_name = original_path.stem
-
-            # 确定输出根目录（博客根目录/source/_posts）
-            output_root = Path(self.output_root) if self.output_root else original_path.parent
-            posts_dir = output_root / "source" / "_posts"
-            posts_dir.mkdir(parents=True, exist_ok=True)
-
-            # 创建目标文件夹（在source/_posts/example）
-            target_folder = posts_dir / folder_name
-            target_folder.mkdir(exist_ok=True)
-
-            # 读取原始内容
-            with open(self.md_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-
-            # 处理图片
-            image_urls = list(set(re.findall(r'!\[.*?\]\((.*?)\)', content)))
-            total_images = len(image_urls)
-            processed = 0
-            failed_images = []
-
-            for url in image_urls:
-                try:
-                    # 检查 URL 是否有效
-                    download_url = url
-                    if not self.is_valid_url(url) and self.image_url_prefix:
-                        # 如果 URL 无协议头，尝试补充前缀
-                        download_url = urllib.parse.urljoin(self.image_url_prefix, url)
-                        self.progress.emit(f"补充 URL 前缀: {url} -> {download_url}", 0)
-
-                    parsed_url = urllib.parse.urlparse(download_url)
-                    original_filename = self.safe_filename(parsed_url.path)
-
-                    # 补充扩展名
-                    if not os.path.splitext(original_filename)[1]:
-                        try:
-                            response = requests.head(download_url, timeout=5, allow_redirects=True)
-                            content_type = response.headers.get('Content-Type', '').split('/')[-1]
-                            if content_type in ['jpeg', 'png', 'gif', 'webp']:
-                                original_filename += f".{content_type}"
-                            else:
-                                original_filename += ".png"
-                        except:
-                            original_filename += ".png"
-
-                    save_path = self.get_unique_path(target_folder, original_filename)
-
-                    # 下载图片
-                    response = requests.get(download_url, stream=True, timeout=10)
-                    if response.status_code == 200:
-                        with open(save_path, 'wb') as img_file:
-                            for chunk in response.iter_content(1024):
-                                if chunk:
-                                    img_file.write(chunk)
-                        # 使用相对路径替换图片链接，如 example/image.jpg
-                        relative_path = f"{folder_name}/{save_path.name}"
-                        content = content.replace(url, relative_path)
-                        self.progress.emit(f"✅ 下载成功: {save_path.name}", int((processed + 1) / total_images * 100))
-                        processed += 1
-                    else:
-                        failed_images.append(url)
-                        self.progress.emit(f"❌ 下载失败: HTTP {response.status_code} for {download_url}", 0)
-                except Exception as e:
-                    failed_images.append(url)
-                    self.progress.emit(f"❌ 下载失败: {str(e)} for {download_url}", 0)
-
-            # 如果有下载失败的图片，警告用户
-            if failed_images:
-                self.progress.emit(f"⚠️ 警告: {len(failed_images)} 张图片下载失败，原始路径已保留", 0)
-
-            # 添加Front Matter
-            front_matter = '---\n'
-            for key, value in self.front_matter.items():
-                if isinstance(value, list):
-                    value = f"[{', '.join(value)}]"
-                front_matter += f"{key}: {value}\n"
-            front_matter += '---\n\n'
-            content = front_matter + content
-
-            # 保存处理后的文件（到source/_posts）
-            output_path = posts_dir / f"{folder_name}.md"
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(content)
-
-            self.finished.emit(True)
+            docs = YuqueSync(client, self.namespace, SYNC_DIR, progress=self.progress.emit,
+                             run_report=self.run_report).sync()
         except Exception as e:
-            self.progress.emit(f"💥 处理失败: {str(e)}", 0)
-            self.finished.emit(False)
+            self.progress.emit(f"❌ 同步知识库失败: {str(e)}", 0)
+            docs = None
+        finally:
+            client.close()
+        self.finished.emit(docs)
+
+
+class ConversionJob:
+    """队列中的单个文件任务"""
+
+    def __init__(self, index, md_path, thread):
+        self.index = index
+        self.md_path = md_path
+        self.thread = thread
+        self.state = 'queued'
+        self.percent = 0
+
+
+class JobQueue(QObject):
+    """多文件转换队列：限制同时运行的文件数，记录每个任务的状态（queued/running/done/failed/cancelled）"""
+    log = pyqtSignal(str)
+    progress = pyqtSignal(int)
+    state_changed = pyqtSignal(int, str)
+    all_finished = pyqtSignal(dict)
+
+    def __init__(self, max_running=2, parent=None, keep_finished=True):
+        super().__init__(parent)
+        self.max_running = max(1, max_running)
+        # 长时间运行的队列（监视模式）不保留已结束的任务，避免线程和转换器一直占用内存
+        self.keep_finished = keep_finished
+        self.jobs = []
+        self.next_index = 0
+        self.percent_sum = 0
+        self.cancelling = False
+        self.summary_sent = False
+
+    def add(self, md_path, thread):
+        job = ConversionJob(self.next_index, md_path, thread)
+        self.next_index += 1
+        thread.progress.connect(lambda message, percent, job=job: self.on_job_progress(job, message, percent))
+        thread.finished.connect(lambda success, job=job: self.on_job_finished(job, success))
+        self.jobs.append(job)
+        self.state_changed.emit(job.index, job.state)
+        return job
+
+    def start(self):
+        self.start_next()
+
+    def cancel(self):
+        """取消排队中的任务，并通知运行中的任务尽快停止"""
+        self.cancelling = True
+        for job in self.jobs:
+            if job.state == 'queued':
+                self.set_state(job, 'cancelled')
+            elif job.state == 'running':
+                job.thread.cancel()
+        self.drop_finished()
+        self.check_all_finished()
+
+    def set_state(self, job, state):
+        job.state = state
+        self.state_changed.emit(job.index, state)
+
+    def start_next(self):
+        running = sum(1 for job in self.jobs if job.state == 'running')
+        for job in self.jobs:
+            if running >= self.max_running or self.cancelling:
+                break
+            if job.state == 'queued':
+                self.set_state(job, 'running')
+                job.thread.start()
+                running += 1
+
+    def set_percent(self, job, percent):
+        """累加所有任务的进度，避免每次都遍历全部任务"""
+        percent = max(job.percent, percent)
+        self.percent_sum += percent - job.percent
+        job.percent = percent
+
+    def on_job_progress(self, job, message, percent):
+        self.set_percent(job, percent)
+        self.log.emit(message)
+        self.progress.emit(self.total_percent())
+
+    def on_job_finished(self, job, success):
+        self.set_percent(job, 100)
+        if self.cancelling and not success:
+            self.set_state(job, 'cancelled')
+        else:
+            self.set_state(job, 'done' if success else 'failed')
+        name = Path(job.md_path).name
+        self.log.emit(f"🎉 处理完成: {name}" if success else f"❌ 处理过程中发生错误: {name}")
+        self.progress.emit(self.total_percent())
+        self.start_next()
+        self.drop_finished()
+        self.check_all_finished()
+
+    def drop_finished(self):
+        if self.keep_finished:
+            return
+        finished = [job for job in self.jobs if job.state in ('done', 'failed', 'cancelled')]
+        for job in finished:
+            # 自定义的 finished 信号在 run() 返回前发出，等线程真正退出后再释放
+            job.thread.wait()
+            self.percent_sum -= job.percent
+        self.jobs = [job for job in self.jobs if job.state in ('queued', 'running')]
+
+    def total_percent(self):
+        if not self.jobs:
+            return 0
+        return int(self.percent_sum / len(self.jobs))
+
+    def is_running(self):
+        return any(job.state in ('queued', 'running') for job in self.jobs)
+
+    def check_all_finished(self):
+        if self.summary_sent or self.is_running():
+            return
+        self.summary_sent = True
+        summary = {state: 0 for state in ('done', 'failed', 'cancelled')}
+        for job in self.jobs:
+            summary[job.state] += 1
+        self.all_finished.emit(summary)
 
 
 class HexoEditor(QMainWindow):
@@ -144,8 +314,37 @@ class HexoEditor(QMainWindow):
         super().__init__()
         self.default_root = r"E:\blog\suhaynn"
         self.config = {'categories': [], 'tags': []}
+        self.image_cache = None
+        self.optimize_pool = None
+        self.style_cache = None
+        self.first_painted = False
+        self.startup_times = {}
+        self.exit_after_startup = False
+        self.job_queue = None
+        self.retry_worker = None
+        self.sync_worker = None
+        self.localize_worker = None
+        self.job_rows = []
+        self.row_states = {}
+        self.watch_worker = None
+        self.watch_queue = None
+        self.watch_jobs = {}
+        self.watch_latest = {}
+        self.watch_rerun = {}
+        self.watch_localizer = None
+        self.watch_localize_again = False
+        self.run_report = None
+        self.taxonomy_worker = None
+        self.taxonomy_reload = False
+        self.pending_log = []
+        self.pending_percent = None
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.setInterval(LOG_FLUSH_INTERVAL_MS)
+        self.flush_timer.timeout.connect(self.flush_log)
         self.load_config()
         self.init_ui()
+        self.apply_cached_style()
         self.current_file = None
 
     def init_ui(self):
@@ -209,8 +408,47 @@ class HexoEditor(QMainWindow):
         self.image_prefix_input.setToolTip("输入图片的URL前缀，用于修复无效URL\n例如: https://cdn.yuque.com/")
         self.image_prefix_input.setText("https://cdn.yuque.com/")
         image_prefix_layout.addWidget(self.image_prefix_input)
+
+        concurrency_label = QLabel("并发下载数:")
+        concurrency_label.setStyleSheet("font-weight: bold;")
+        image_prefix_layout.addWidget(concurrency_label)
+
+        self.concurrency_input = QSpinBox(self)
+        self.concurrency_input.setRange(1, 32)
+        self.concurrency_input.setValue(8)
+        self.concurrency_input.setToolTip("同时下载的图片数量上限")
+        image_prefix_layout.addWidget(self.concurrency_input)
         settings_layout.addWidget(image_prefix_group)
 
+        # 图片优化设置（需要 Pillow）
+        optimize_group = QGroupBox("图片优化")
+        optimize_layout = QHBoxLayout(optimize_group)
+
+        self.optimize_check = QCheckBox("下载后压缩图片", self)
+        self.optimize_check.setToolTip("在多进程中压缩/转换已下载的图片，需要安装 Pillow")
+        optimize_layout.addWidget(self.optimize_check)
+
+        optimize_layout.addWidget(QLabel("最大宽度:"))
+        self.max_width_input = QSpinBox(self)
+        self.max_width_input.setRange(0, 10000)
+        self.max_width_input.setValue(DEFAULT_OPTIMIZE_OPTIONS['max_width'])
+        self.max_width_input.setToolTip("超过该宽度的图片会等比缩小，0 表示不缩放")
+        optimize_layout.addWidget(self.max_width_input)
+
+        optimize_layout.addWidget(QLabel("质量:"))
+        self.quality_input = QSpinBox(self)
+        self.quality_input.setRange(1, 100)
+        self.quality_input.setValue(DEFAULT_OPTIMIZE_OPTIONS['quality'])
+        optimize_layout.addWidget(self.quality_input)
+
+        optimize_layout.addWidget(QLabel("输出格式:"))
+        self.format_combo = QComboBox(self)
+        self.format_combo.addItem("保持原格式", None)
+        self.format_combo.addItem("WebP", "webp")
+        optimize_layout.addWidget(self.format_combo)
+        optimize_layout.addStretch()
+        settings_layout.addWidget(optimize_group)
+
         # 文件区域
         file_group = QGroupBox("文件处理")
         file_layout = QVBoxLayout(file_group)
@@ -231,6 +469,25 @@ class HexoEditor(QMainWindow):
         file_layout.addWidget(self.file_list)
         settings_layout.addWidget(file_group)
 
+        # 语雀知识库同步
+        sync_group = QGroupBox("语雀知识库同步")
+        sync_group.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
+        sync_layout = QHBoxLayout(sync_group)
+        sync_layout.addWidget(QLabel("知识库:"))
+        self.namespace_input = QLineEdit(self)
+        self.namespace_input.setPlaceholderText("user/book")
+        sync_layout.addWidget(self.namespace_input)
+        sync_layout.addWidget(QLabel("Token:"))
+        self.token_input = QLineEdit(self)
+        self.token_input.setEchoMode(QLineEdit.Password)
+        self.token_input.setToolTip("语雀 OpenAPI Token，不会保存到配置文件")
+        sync_layout.addWidget(self.token_input)
+        self.sync_btn = QPushButton("同步知识库", self)
+        self.sync_btn.setToolTip("只拉取有更新的文档，并按上方设置转换为 Hexo 文章")
+        self.sync_btn.clicked.connect(self.sync_knowledge_base)
+        sync_layout.addWidget(self.sync_btn)
+        settings_layout.addWidget(sync_group)
+
         # 元数据区域 - 使用水平布局
         meta_group = QGroupBox("文章元数据")
         meta_layout = QHBoxLayout(meta_group)
@@ -361,6 +618,51 @@ class HexoEditor(QMainWindow):
         self.process_btn.clicked.connect(self.start_processing)
         process_layout.addWidget(self.process_btn)
 
+        self.cancel_btn = QPushButton("取消", self)
+        self.cancel_btn.setEnabled(False)
+        self.cancel_btn.clicked.connect(self.cancel_processing)
+        process_layout.addWidget(self.cancel_btn)
+
+        self.retry_btn = QPushButton("仅重试失败图片", self)
+        self.retry_btn.setToolTip("只重新下载上次永久失败的图片，并修正已写出的文章")
+        self.retry_btn.clicked.connect(self.retry_failed)
+        process_layout.addWidget(self.retry_btn)
+
+        self.watch_btn = QPushButton("监视文件夹", self)
+        self.watch_btn.setCheckable(True)
+        self.watch_btn.setToolTip("持续监视收件箱文件夹，新增或修改的 .md / .zip 写入完成后自动转换")
+        self.watch_btn.toggled.connect(self.toggle_watch)
+        process_layout.addWidget(self.watch_btn)
+
+        parallel_label = QLabel("同时处理文件数:")
+        process_layout.addWidget(parallel_label)
+
+        self.parallel_input = QSpinBox(self)
+        self.parallel_input.setRange(1, 8)
+        self.parallel_input.setValue(2)
+        self.parallel_input.setToolTip("同时转换的文件数上限，其余文件排队等待")
+        process_layout.addWidget(self.parallel_input)
+
+        self.incremental_check = QCheckBox("增量处理", self)
+        self.incremental_check.setChecked(True)
+        self.incremental_check.setToolTip("跳过未修改的文章，已下载的图片只做条件请求验证")
+        process_layout.addWidget(self.incremental_check)
+
+        self.shared_assets_check = QCheckBox("共享图片库", self)
+        self.shared_assets_check.setToolTip("相同内容的图片只在 source/.yuque-to-hexo-assets 中保存一份，"
+                                            "文章图片文件夹中使用硬链接（不支持时复制），文章中的链接不变")
+        process_layout.addWidget(self.shared_assets_check)
+
+        self.search_index_check = QCheckBox("更新搜索索引", self)
+        self.search_index_check.setToolTip("每批转换结束后就地更新 public/search.xml（hexo-generator-search），"
+                                           "新文章无需重新 hexo generate 即可被站内搜索找到")
+        process_layout.addWidget(self.search_index_check)
+
+        self.lazy_images_check = QCheckBox("先写文字", self)
+        self.lazy_images_check.setToolTip("先写出保留原始图片链接的文章以便立即预览，全部写完后再按队列下载图片并替换链接；"
+                                           "中断后下次处理时继续")
+        process_layout.addWidget(self.lazy_images_check)
+
         self.progress_bar = QProgressBar(self)
         self.progress_bar.setAlignment(Qt.AlignCenter)
         self.progress_bar.setStyleSheet("""
@@ -386,11 +688,13 @@ class HexoEditor(QMainWindow):
         log_layout.addWidget(process_group)
 
         # 日志输出
-        self.log_output = QTextEdit(self)
+        # 纯文本日志，超过最大行数时自动丢弃最早的行
+        self.log_output = QPlainTextEdit(self)
         self.log_output.setReadOnly(True)
+        self.log_output.setMaximumBlockCount(LOG_MAX_LINES)
         self.log_output.setFont(self.mono_font)
         self.log_output.setStyleSheet("""
-            QTextEdit {
+            QPlainTextEdit {
                 background-color: #1E1E1E;
                 color: #D4D4D4;
                 border: 1px solid #444;
@@ -404,37 +708,88 @@ class HexoEditor(QMainWindow):
         # 设置分割器初始比例
         splitter.setSizes([400, 200])
 
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.first_painted:
+            self.first_painted = True
+            QTimer.singleShot(0, self.on_first_paint)
+
+    def on_first_paint(self):
+        """窗口显示后再做较慢的初始化：注册样式资源、扫描博客的分类和标签，并记录启动耗时"""
+        self.startup_times = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'import_ms': round((STARTUP_IMPORTED - STARTUP_BEGIN) * 1000, 1),
+            'first_paint_ms': round((time.perf_counter() - STARTUP_BEGIN) * 1000, 1),
+            'style_cached': self.style_cache is not None,
+        }
+        self.load_style()
         # 加载分类和标签
-        self.load_categories()
-        self.load_tags()
+        self.load_taxonomy()
+        self.startup_times['ready_ms'] = round((time.perf_counter() - STARTUP_BEGIN) * 1000, 1)
+        self.record_startup()
+        if self.exit_after_startup:
+            print(json.dumps(self.startup_times))
+            if self.taxonomy_worker:
+                self.taxonomy_worker.wait()
+            QApplication.instance().quit()
+
+    def record_startup(self):
+        """把启动耗时追加到 run_reports/startup.jsonl，便于跨版本对比"""
+        try:
+            STARTUP_LOG.parent.mkdir(parents=True, exist_ok=True)
+            with open(STARTUP_LOG, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(self.startup_times) + '\n')
+        except OSError:
+            pass
+
+    def apply_cached_style(self):
+        """启动时直接应用上次缓存的样式表，首次绘制前不导入 qdarkstyle"""
+        try:
+            with open(STYLE_CACHE, 'r', encoding='utf-8') as f:
+                self.style_cache = json.load(f)
+            self.setStyleSheet(self.style_cache['stylesheet'] + APP_STYLESHEET)
+        except (OSError, ValueError, KeyError, TypeError):
+            self.style_cache = None
+
+    def load_style(self):
+        """缓存与已安装的 qdarkstyle 版本一致时只注册图标资源并修正调色板，否则重新生成样式表并写入缓存"""
+        import qdarkstyle
+        if self.style_cache and self.style_cache.get('version') == qdarkstyle.__version__:
+            os.environ.setdefault('QT_API', 'pyqt5')
+            # 导入资源模块即注册样式表引用的图标
+            from qdarkstyle.dark import darkstyle_rc  # noqa: F401
+            app = QApplication.instance()
+            palette = app.palette()
+            palette.setColor(QPalette.Normal, QPalette.Link, QColor(qdarkstyle.DarkPalette.COLOR_ACCENT_3))
+            app.setPalette(palette)
+            # 重新应用一次，使样式表中引用的图标生效
+            self.setStyleSheet(self.styleSheet())
+            return
 
-        # 应用样式表
-        self.setStyleSheet(qdarkstyle.load_stylesheet_pyqt5() + """
-            QGroupBox {
-                border: 1px solid #444;
-                border-radius: 5px;
-                margin-top: 10px;
-                padding-top: 15px;
-            }
-            QGroupBox::title {
-                subcontrol-origin: margin;
-                left: 10px;
-                padding: 0 3px;
-            }
-            QLabel {
-                padding: 5px 0;
-            }
-            QLineEdit, QDateEdit, QComboBox {
-                padding: 5px;
-                border: 1px solid #444;
-                border-radius: 4px;
-                background: #2B2B2B;
-            }
-            QSplitter::handle {
-                background: #444;
-                height: 5px;
-            }
-        """)
+        stylesheet = qdarkstyle.load_stylesheet_pyqt5()
+        self.setStyleSheet(stylesheet + APP_STYLESHEET)
+        self.style_cache = {'version': qdarkstyle.__version__, 'stylesheet': stylesheet}
+        try:
+            tmp_path = STYLE_CACHE.with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.style_cache, f, ensure_ascii=False)
+            os.replace(tmp_path, STYLE_CACHE)
+        except OSError:
+            pass
+
+    def get_image_cache(self):
+        """图片缓存在第一次处理时才加载索引"""
+        if self.image_cache is None:
+            self.image_cache = ImageCache(Path("image_cache"))
+        return self.image_cache
+
+    def get_optimize_pool(self):
+        """开启压缩时返回本次会话共用的进程池，第一次压缩时才创建，关闭窗口时结束"""
+        if not self.optimize_check.isChecked():
+            return None
+        if self.optimize_pool is None:
+            self.optimize_pool = create_optimize_pool(self.get_optimize_options())
+        return self.optimize_pool
 
     def on_output_combo_changed(self, index):
         if index == 1:  # 选择"选择其他目录..."
@@ -443,8 +798,7 @@ class HexoEditor(QMainWindow):
                 self.output_combo.insertItem(0, directory)
                 self.output_combo.setCurrentIndex(0)
                 # 重新加载分类和标签
-                self.load_categories()
-                self.load_tags()
+                self.load_taxonomy()
             else:
                 self.output_combo.setCurrentIndex(0)
 
@@ -461,41 +815,49 @@ class HexoEditor(QMainWindow):
     def dropEvent(self, event: QDropEvent):
         for url in event.mimeData().urls():
             path = url.toLocalFile()
-            if path.lower().endswith('.md'):
+            if path.lower().endswith(('.md', '.zip')):
                 self.file_list.addItem(path)
                 if not self.current_file:
                     self.current_file = path
                     self.title_input.setText(Path(path).stem)
 
-    def load_categories(self):
-        """从博客根目录的public/categories读取分类"""
-        self.category_list.clear()
-        output_root = self.get_output_path()
-        if output_root:
-            categories_path = Path(output_root) / "public" / "categories"
-            if categories_path.exists():
-                for category in categories_path.iterdir():
-                    if category.is_dir():
-                        self.category_list.addItem(category.name)
-        config_categories = self.config.get('categories', [])
-        for category in config_categories:
-            if not self.category_list.findItems(category, Qt.MatchExactly):
-                self.category_list.addItem(category)
-
-    def load_tags(self):
-        """从博客根目录的public/tags读取标签"""
-        self.tags_list.clear()
+    def load_taxonomy(self):
+        """在后台线程中从 source/_posts 的 Front Matter 刷新分类和标签"""
         output_root = self.get_output_path()
-        if output_root:
-            tags_path = Path(output_root) / "public" / "tags"
-            if tags_path.exists():
-                for tag in tags_path.iterdir():
-                    if tag.is_dir():
-                        self.tags_list.addItem(tag.name)
-        config_tags = self.config.get('tags', [])
-        for tag in config_tags:
-            if not self.tags_list.findItems(tag, Qt.MatchExactly):
-                self.tags_list.addItem(tag)
+        if not output_root:
+            self.on_taxonomy_loaded(Counter(), Counter())
+            return
+        if self.taxonomy_worker and self.taxonomy_worker.isRunning():
+            self.taxonomy_reload = True
+            return
+        self.taxonomy_worker = TaxonomyThread(output_root)
+        self.taxonomy_worker.loaded.connect(self.on_taxonomy_loaded)
+        self.taxonomy_worker.start()
+
+    def on_taxonomy_loaded(self, categories, tags):
+        self.fill_taxonomy_list(self.category_list, categories, self.config.get('categories', []))
+        self.fill_taxonomy_list(self.tags_list, tags, self.config.get('tags', []))
+        if self.taxonomy_reload:
+            self.taxonomy_reload = False
+            self.load_taxonomy()
+
+    def fill_taxonomy_list(self, list_widget, counts, extra):
+        """按使用次数从多到少填充列表，配置中记录但博客中尚未使用的条目排在最后，保留已选中的条目"""
+        selected = {item.text() for item in list_widget.selectedItems()}
+        names = [name for name, _ in counts.most_common()]
+        names.extend(name for name in dict.fromkeys(extra) if name not in counts)
+        list_widget.blockSignals(True)
+        list_widget.setUpdatesEnabled(False)
+        list_widget.clear()
+        for name in names:
+            item = QListWidgetItem(name)
+            if counts[name]:
+                item.setToolTip(f"{counts[name]} 篇文章")
+            list_widget.addItem(item)
+            if name in selected:
+                item.setSelected(True)
+        list_widget.setUpdatesEnabled(True)
+        list_widget.blockSignals(False)
 
     def update_category_input(self):
         """将选中的分类更新到输入框"""
@@ -531,75 +893,430 @@ class HexoEditor(QMainWindow):
         self.config.setdefault('tags', [])
 
     def save_config(self):
+        """只记录手动输入过的分类和标签（博客中已有的由索引提供），没有新增时不写文件"""
         input_categories = [cat.strip() for cat in self.category_input.text().split(',') if cat.strip()]
-        list_categories = [self.category_list.item(i).text() for i in range(self.category_list.count())]
-        all_categories = list(set(input_categories + list_categories))
-
         input_tags = [tag.strip() for tag in self.tags_input.text().split(',') if tag.strip()]
-        list_tags = [self.tags_list.item(i).text() for i in range(self.tags_list.count())]
-        all_tags = list(set(input_tags + list_tags))
 
         config = {
-            'categories': all_categories,
-            'tags': all_tags
+            'categories': list(dict.fromkeys(self.config['categories'] + input_categories)),
+            'tags': list(dict.fromkeys(self.config['tags'] + input_tags))
         }
+        if config['categories'] == self.config['categories'] and config['tags'] == self.config['tags']:
+            return
+        self.config.update(config)
         with open(self.config_file, 'w') as f:
             json.dump(config, f, indent=2)
 
-    def get_front_matter(self):
+    def get_front_matter(self, path=None):
+        """界面上填写的 Front Matter，标题留空时取 path（默认为当前文件）的文件名"""
         return {
-            'title': self.title_input.text() or Path(self.current_file).stem,
+            'title': self.title_input.text() or Path(path or self.current_file).stem,
             'date': self.date_input.date().toString("yyyy-MM-dd"),
             'categories': [x.strip() for x in self.category_input.text().split(',') if x.strip()],
             'tags': [tag.strip() for tag in self.tags_input.text().split(',') if tag.strip()]
         }
 
+    def get_optimize_options(self):
+        if not self.optimize_check.isChecked():
+            return None
+        return {
+            'max_width': self.max_width_input.value(),
+            'quality': self.quality_input.value(),
+            'format': self.format_combo.currentData(),
+        }
+
+    def is_busy(self):
+        return ((self.job_queue and self.job_queue.is_running())
+                or (self.retry_worker and self.retry_worker.isRunning())
+                or (self.sync_worker and self.sync_worker.isRunning())
+                or (self.localize_worker and self.localize_worker.isRunning()))
+
+    def prepare_output_root(self):
+        """确保博客根目录存在，失败时提示并返回 None"""
+        output_root = self.get_output_path()
+        if output_root and not Path(output_root).exists():
+            try:
+                Path(output_root).mkdir(parents=True, exist_ok=True)
+            except Exception as e:
+                QMessageBox.critical(self, "错误", f"无法创建博客根目录: {str(e)}")
+                return None
+        return output_root
+
     def start_processing(self):
         if not hasattr(self, 'file_list') or self.file_list.count() == 0:
             QMessageBox.warning(self, "警告", "请先选择MD文件!")
             return
+        if self.is_busy():
+            QMessageBox.warning(self, "警告", "当前批次仍在处理中!")
+            return
 
         self.save_config()
         self.progress_bar.show()
         self.progress_bar.setValue(0)
-        self.log_output.clear()
+        self.clear_log()
 
-        output_root = self.get_output_path()
-        if output_root and not Path(output_root).exists():
-            try:
-                Path(output_root).mkdir(parents=True, exist_ok=True)
-            except Exception as e:
-                QMessageBox.critical(self, "错误", f"无法创建博客根目录: {str(e)}")
-                return
+        output_root = self.prepare_output_root()
+        if output_root is None:
+            return
 
+        tasks = []
         for i in range(self.file_list.count()):
             md_path = self.file_list.item(i).text()
             self.current_file = md_path
-            self.worker = DownloadThread(md_path, self.get_front_matter(), output_root,
-                                         self.image_prefix_input.text().strip())
-            self.worker.progress.connect(self.update_progress)
-            self.worker.finished.connect(self.on_finished)
-            self.worker.start()
+            for _, source, front_matter, archive in self.conversion_tasks(md_path):
+                tasks.append((i, source, front_matter, archive))
+        self.run_jobs(tasks, output_root)
+
+    def run_jobs(self, tasks, output_root, run_report=None):
+        """tasks 为 [(文件列表行号, 源文件, Front Matter, 压缩包)]，行号为 -1 表示不在文件列表中（如同步的文档）；
+        传入 run_report 时继续写入同一份运行报告（如同步阶段的事件）"""
+        self.run_report = run_report or RunReport()
+        self.job_queue = JobQueue(self.parallel_input.value(), self)
+        self.job_queue.log.connect(self.append_log)
+        self.job_queue.progress.connect(self.set_progress)
+        self.job_queue.state_changed.connect(self.on_job_state_changed)
+        self.job_queue.all_finished.connect(self.on_finished)
+        self.job_rows = []
+        self.row_states = {}
+        for row, source, front_matter, archive in tasks:
+            self.job_rows.append(row)
+            self.job_queue.add(source, self.create_worker(source, front_matter, output_root, archive))
+
+        self.process_btn.setEnabled(False)
+        self.retry_btn.setEnabled(False)
+        self.sync_btn.setEnabled(False)
+        self.cancel_btn.setEnabled(True)
+        self.job_queue.start()
+
+    def sync_knowledge_base(self):
+        namespace = self.namespace_input.text().strip().strip('/')
+        token = self.token_input.text().strip()
+        if not namespace or not token:
+            QMessageBox.warning(self, "警告", "请填写知识库（user/book）和 Token!")
+            return
+        if self.is_busy():
+            QMessageBox.warning(self, "警告", "当前批次仍在处理中!")
+            return
 
-    def update_progress(self, message, percent):
-        self.progress_bar.setValue(percent)
-        self.log_output.append(message)
-        cursor = self.log_output.textCursor()
-        cursor.movePosition(cursor.End)
-        self.log_output.setTextCursor(cursor)
-        self.log_output.ensureCursorVisible()
-
-    def on_finished(self, success):
-        if success:
-            self.log_output.append("🎉 处理完成！")
+        self.save_config()
+        self.clear_log()
+        self.progress_bar.show()
+        self.progress_bar.setValue(0)
+        self.process_btn.setEnabled(False)
+        self.retry_btn.setEnabled(False)
+        self.sync_btn.setEnabled(False)
+        self.run_report = RunReport()
+        self.sync_worker = SyncThread(namespace, token, self.concurrency_input.value(), self.run_report)
+        self.sync_worker.progress.connect(self.update_progress)
+        self.sync_worker.finished.connect(self.on_sync_finished)
+        self.sync_worker.start()
+
+    def on_sync_finished(self, docs):
+        """同步的文档按清单增量转换：未变化的文档会被跳过，上次失败的会重新处理"""
+        output_root = self.prepare_output_root() if docs else None
+        if output_root is None:
+            self.save_run_report()
             self.progress_bar.hide()
+            self.process_btn.setEnabled(True)
+            self.retry_btn.setEnabled(True)
+            self.sync_btn.setEnabled(True)
+            return
+        tasks = []
+        for md_path, synced in docs:
+            self.current_file = str(md_path)
+            front_matter = self.get_front_matter()
+            front_matter.update(synced)
+            tasks.append((-1, str(md_path), front_matter, None))
+        self.run_jobs(tasks, output_root, self.run_report)
+
+    def conversion_tasks(self, path):
+        """返回 [(标识, 源文件, Front Matter, 压缩包)]；压缩包中的每篇文档各一项，知识库目录追加为层级分类，标题取文档名"""
+        if not path.lower().endswith('.zip'):
+            return [(path, path, self.get_front_matter(path), None)]
+        try:
+            archive = YuqueArchive.for_path(path)
+        except Exception as e:
+            self.append_log(f"❌ 无法读取压缩包: {Path(path).name} ({str(e)})")
+            return []
+        self.append_log(f"📦 {Path(path).name}: {len(archive.posts)} 篇文档")
+        tasks = []
+        for member in archive.posts:
+            front_matter = self.get_front_matter(path)
+            front_matter['title'] = PurePosixPath(member).stem
+            front_matter['categories'] = front_matter['categories'] + archive.categories(member)
+            tasks.append((archive.virtual_path(member), member, front_matter, archive))
+        return tasks
+
+    def create_worker(self, md_path, front_matter, output_root, archive=None):
+        return DownloadThread(md_path, front_matter, output_root, self.image_prefix_input.text().strip(),
+                              self.concurrency_input.value(), self.get_image_cache(),
+                              self.incremental_check.isChecked(), self.get_optimize_options(), self.run_report, archive,
+                              self.shared_assets_check.isChecked(), self.search_index_check.isChecked(),
+                              self.lazy_images_check.isChecked(), self.get_optimize_pool())
+
+    def toggle_watch(self, checked):
+        """开始/停止监视收件箱文件夹，转换使用独立的任务队列，不影响手动批次"""
+        if not checked:
+            if self.watch_worker:
+                self.watch_worker.stop()
+                self.watch_worker.wait()
+                self.watch_worker = None
+                if self.watch_localizer:
+                    self.watch_localizer.cancel()
+                self.append_log("🛑 已停止监视")
+            self.watch_btn.setText("监视文件夹")
+            return
+
+        directory = QFileDialog.getExistingDirectory(self, "选择要监视的文件夹", self.get_output_path())
+        if not directory:
+            self.watch_btn.setChecked(False)
+            return
+        self.save_config()
+        self.watch_queue = JobQueue(self.parallel_input.value(), self, keep_finished=False)
+        self.watch_queue.log.connect(self.append_log)
+        self.watch_queue.state_changed.connect(self.on_watch_job_state_changed)
+        self.watch_jobs = {}
+        self.watch_latest = {}
+        self.watch_rerun = {}
+        self.watch_worker = WatchThread(directory)
+        self.watch_worker.file_ready.connect(self.on_watch_file_ready)
+        self.watch_worker.start()
+        self.watch_btn.setText("停止监视")
+        self.append_log(f"👀 正在监视: {directory}")
+
+    def on_watch_file_ready(self, path):
+        """排队中的同一文件无需重复添加；正在转换时记下来，结束后再转换一次"""
+        for key, source, front_matter, archive in self.conversion_tasks(path):
+            if not archive:
+                front_matter['title'] = Path(path).stem
+            latest = self.watch_latest.get(key)
+            if latest and latest.state == 'queued':
+                continue
+            if latest and latest.state == 'running':
+                self.watch_rerun[key] = (source, front_matter, archive)
+                continue
+            self.add_watch_job(key, source, front_matter, archive)
+
+    def add_watch_job(self, key, source, front_matter, archive):
+        """watch_jobs 只记录未结束的任务（任务序号→文件），watch_latest 记录每个文件最近的任务"""
+        self.watch_jobs[self.watch_queue.next_index] = key
+        self.watch_latest[key] = self.watch_queue.add(
+            source, self.create_worker(source, front_matter, self.get_output_path(), archive))
+        self.watch_queue.start_next()
+
+    def on_watch_job_state_changed(self, index, state):
+        key = self.watch_jobs.get(index)
+        if key is None:
+            return
+        if state in ('done', 'failed', 'cancelled'):
+            del self.watch_jobs[index]
+            if self.watch_latest.get(key) and self.watch_latest[key].index == index:
+                del self.watch_latest[key]
+        if state in ('done', 'failed', 'cancelled') and key in self.watch_rerun:
+            self.add_watch_job(key, *self.watch_rerun.pop(key))
+        elif state == 'done':
+            # 新文章可能带来新的分类和标签
+            self.load_taxonomy()
+            if self.lazy_images_check.isChecked():
+                self.localize_watch_queue()
+        if not self.watch_queue.is_running():
+            # 等待下一次导出时不占用压缩包，否则 Windows 上导出工具无法替换它；缓存的搜索索引条目也在此时写回
+            YuqueArchive.release_all()
+            self.flush_search_index()
+
+    def localize_watch_queue(self):
+        """监视模式下先写出的文章：同一时间只运行一个下载队列任务，运行期间有新文章时结束后再处理一次"""
+        if self.watch_localizer and self.watch_localizer.isRunning():
+            self.watch_localize_again = True
+            return
+        self.watch_localize_again = False
+        self.watch_localizer = LocalizeThread(self.get_output_path(), self.image_prefix_input.text().strip(),
+                                              self.concurrency_input.value(), self.get_image_cache(), None,
+                                              self.shared_assets_check.isChecked(), self.get_optimize_options(),
+                                              self.get_optimize_pool())
+        self.watch_localizer.progress.connect(lambda message, percent: self.append_log(message))
+        self.watch_localizer.finished.connect(self.on_watch_localized)
+        self.watch_localizer.start()
+
+    def on_watch_localized(self, remaining):
+        YuqueArchive.release_all()
+        if remaining:
+            self.append_log(f"⚠️ {remaining} 张图片下载失败")
+        if self.watch_localize_again and self.watch_worker:
+            self.localize_watch_queue()
+
+    def retry_failed(self):
+        output_root = self.get_output_path()
+        if not output_root:
+            QMessageBox.warning(self, "警告", "请先设置博客根目录!")
+            return
+        if self.is_busy():
+            QMessageBox.warning(self, "警告", "当前批次仍在处理中!")
+            return
+
+        self.clear_log()
+        self.progress_bar.show()
+        self.progress_bar.setValue(0)
+        self.process_btn.setEnabled(False)
+        self.retry_btn.setEnabled(False)
+        self.sync_btn.setEnabled(False)
+        self.run_report = RunReport()
+        self.retry_worker = RetryFailedThread(output_root, self.image_prefix_input.text().strip(),
+                                              self.concurrency_input.value(), self.get_image_cache(), self.run_report,
+                                              self.shared_assets_check.isChecked())
+        self.retry_worker.progress.connect(self.update_progress)
+        self.retry_worker.finished.connect(self.on_retry_finished)
+        self.retry_worker.start()
+
+    def update_progress(self, message, percent):
+        self.set_progress(percent)
+        self.append_log(message)
+
+    def set_progress(self, percent):
+        self.pending_percent = percent
+        self.schedule_flush()
+
+    def on_retry_finished(self, remaining):
+        if remaining:
+            self.append_log(f"⚠️ 重试结束，仍有 {remaining} 张图片下载失败")
         else:
-            self.log_output.append("❌ 处理过程中发生错误！")
-            self.progress_bar.hide()
+            self.append_log("🎉 失败图片已全部修复！")
+        self.save_run_report()
+        self.progress_bar.hide()
+        self.process_btn.setEnabled(True)
+        self.retry_btn.setEnabled(True)
+        self.sync_btn.setEnabled(True)
+
+    def cancel_processing(self):
+        if self.localize_worker and self.localize_worker.isRunning():
+            self.append_log("🛑 正在取消...")
+            self.cancel_btn.setEnabled(False)
+            self.localize_worker.cancel()
+        elif self.job_queue:
+            self.append_log("🛑 正在取消...")
+            self.cancel_btn.setEnabled(False)
+            self.job_queue.cancel()
+
+    def on_job_state_changed(self, index, state):
+        """在文件列表中标记任务状态；压缩包对应多个任务时显示各状态的数量"""
+        labels = {'queued': "排队中", 'running': "处理中", 'done': "已完成", 'failed': "失败", 'cancelled': "已取消"}
+        row = self.job_rows[index]
+        states = self.row_states.setdefault(row, {})
+        states[index] = state
+        item = self.file_list.item(row)
+        if not item:
+            return
+        if len(states) == 1:
+            item.setToolTip(labels.get(state, state))
+        else:
+            counts = Counter(states.values())
+            item.setToolTip("，".join(f"{labels.get(s, s)} {n}" for s, n in counts.items()))
+
+    def append_log(self, message):
+        """日志先进入缓冲区，由定时器批量写入，避免每条消息都重新布局"""
+        self.pending_log.append(message)
+        self.schedule_flush()
+
+    def clear_log(self):
+        """清空日志以及尚未刷新的日志和进度"""
+        self.pending_log.clear()
+        self.pending_percent = None
+        self.log_output.clear()
+
+    def schedule_flush(self):
+        if not self.flush_timer.isActive():
+            self.flush_timer.start()
+
+    def flush_log(self):
+        """把缓冲的日志与最新进度一次性刷新到界面"""
+        if self.pending_percent is not None:
+            self.progress_bar.setValue(self.pending_percent)
+            self.pending_percent = None
+        if not self.pending_log:
+            return
+        lines = self.pending_log[-LOG_MAX_LINES:]
+        self.pending_log.clear()
+        scrollbar = self.log_output.verticalScrollBar()
+        # 用户向上翻看日志时不自动滚动到底部
+        at_bottom = scrollbar.value() >= scrollbar.maximum()
+        self.log_output.appendPlainText("\n".join(lines))
+        if at_bottom:
+            scrollbar.setValue(scrollbar.maximum())
+
+    def save_run_report(self):
+        """将本批次的结构化事件写入 run_reports/ 下的 JSONL 文件"""
+        if not self.run_report or not self.run_report.events:
+            return
+        path = Path("run_reports") / f"{time.strftime('%Y%m%d-%H%M%S')}.jsonl"
+        try:
+            self.run_report.write_jsonl(path)
+            self.append_log(f"📊 运行报告: {path}")
+        except OSError as e:
+            self.append_log(f"⚠️ 运行报告保存失败: {str(e)}")
+
+    def on_finished(self, summary):
+        self.append_log(f"🏁 全部结束: 成功 {summary['done']}，失败 {summary['failed']}，"
+                        f"取消 {summary['cancelled']}")
+        # 文字都已写出，接着下载队列中的图片（包括上次中断留下的）
+        if self.lazy_images_check.isChecked() and not summary['cancelled'] and self.get_output_path():
+            self.start_localize()
+            return
+        self.finish_batch()
+
+    def start_localize(self):
+        self.localize_worker = LocalizeThread(self.get_output_path(), self.image_prefix_input.text().strip(),
+                                              self.concurrency_input.value(), self.get_image_cache(), self.run_report,
+                                              self.shared_assets_check.isChecked(), self.get_optimize_options(),
+                                              self.get_optimize_pool())
+        self.localize_worker.progress.connect(self.update_progress)
+        self.localize_worker.finished.connect(self.on_localize_finished)
+        self.localize_worker.start()
+
+    def on_localize_finished(self, remaining):
+        if self.localize_worker.cancelled.is_set():
+            self.append_log("⏸️ 图片下载已暂停，下次处理时继续")
+        elif remaining:
+            self.append_log(f"⚠️ 图片下载结束，{remaining} 张图片下载失败")
+        else:
+            self.append_log("🖼️ 图片已全部下载，文章链接已更新")
+        self.finish_batch()
+
+    def flush_search_index(self):
+        for error in SearchIndex.flush_all():
+            self.append_log(f"⚠️ 搜索索引更新失败: {error}")
+
+    def finish_batch(self):
+        # 本批次的清单修改和搜索索引条目一次性写回磁盘，并关闭本批次读取的压缩包
+        PostManifest.flush_all()
+        self.flush_search_index()
+        YuqueArchive.release_all()
+        self.save_run_report()
+        # 新写出的文章可能带来新的分类和标签
+        self.load_taxonomy()
+        self.progress_bar.hide()
+        self.process_btn.setEnabled(True)
+        self.retry_btn.setEnabled(True)
+        self.sync_btn.setEnabled(True)
+        self.cancel_btn.setEnabled(False)
+
+    def closeEvent(self, event):
+        if self.watch_worker:
+            self.watch_worker.stop()
+            self.watch_worker.wait()
+        # 图片下载队列可以随时中断，下次处理时继续
+        for worker in (self.localize_worker, self.watch_localizer):
+            if worker and worker.isRunning():
+                worker.cancel()
+                worker.wait()
+        if self.optimize_pool:
+            self.optimize_pool.shutdown(wait=False, cancel_futures=True)
+        super().closeEvent(event)
 
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
     window = HexoEditor()
+    # --startup-time：输出启动耗时后立即退出，可配合 QT_QPA_PLATFORM=offscreen 在脚本中测量
+    window.exit_after_startup = '--startup-time' in sys.argv
     window.show()
     sys.exit(app.exec_())
\ No newline at end of file
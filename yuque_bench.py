@@ -0,0 +1,437 @@
+# -*- coding: utf-8 -*-
+"""离线基准测试：启动本地模拟 CDN，生成语雀风格的 Markdown，直接驱动转换核心（不依赖 PyQt5）
+
+示例:
+    python yuque_bench.py --posts 5 --images 100 --latency-ms 40 --output bench.json
+    python yuque_bench.py --posts 5 --images 100 --latency-ms 40 --compare bench.json
+    python yuque_bench.py --sync --sync-docs 250 --sync-changed 10 --latency-ms 40
+
+输出每秒图片数、总耗时、峰值内存和 HTTP 请求数，结果保存为 JSON，可在不同提交之间对比。
+--sync 时改为启动模拟语雀 OpenAPI（使用 fixtures/yuque_api.json 中录制的响应），先完整同步一次，
+修改部分文档的 updated_at 后再增量同步，检查只重新获取了有变化的文档且本地正文与接口一致。
+"""
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+
+from urllib.parse import urlsplit, parse_qs
+
+from yuque_core import PostConverter, PostManifest, ImageCache, RunReport, YuqueClient, YuqueSync
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# 最小的合法 PNG 文件头，后面用填充字节凑够图片大小
+PNG_HEADER = b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR'
+
+# 录制的语雀 OpenAPI 响应（文档列表与文档详情）
+YUQUE_API_FIXTURE = Path(__file__).parent / "fixtures" / "yuque_api.json"
+
+
+class FakeCDN:
+    """模拟语雀图床：可配置延迟、带宽、错误率，以及缺少 Content-Type / 扩展名的图片"""
+
+    def __init__(self, latency=0.0, bandwidth=0, error_rate=0.0, image_size=50 * 1024, seed=0):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.image_size = image_size
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.make_handler())
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_port}/"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def body_for(self, path):
+        seed = path.encode('utf-8')
+        return PNG_HEADER + (seed * (self.image_size // max(1, len(seed)) + 1))[:self.image_size - len(PNG_HEADER)]
+
+    def make_handler(self):
+        cdn = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self.respond(send_body=False)
+
+            def do_GET(self):
+                self.respond(send_body=True)
+
+            def respond(self, send_body):
+                with cdn._lock:
+                    cdn.requests += 1
+                    failed = cdn.random.random() < cdn.error_rate
+                if cdn.latency:
+                    time.sleep(cdn.latency)
+                if failed:
+                    self.send_response(503)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                body = cdn.body_for(self.path)
+                start = 0
+                range_header = self.headers.get('Range')
+                if range_header and range_header.startswith('bytes='):
+                    start = min(int(range_header[6:].split('-')[0] or 0), len(body))
+                    self.send_response(206)
+                    self.send_header('Content-Range', f"bytes {start}-{len(body) - 1}/{len(body)}")
+                else:
+                    self.send_response(200)
+                # /raw/ 路径模拟缺少 Content-Type 且无扩展名的图片
+                if not self.path.startswith('/raw/'):
+                    self.send_header('Content-Type', 'image/png')
+                self.send_header('ETag', f'"{len(body)}"')
+                self.send_header('Content-Length', str(len(body) - start))
+                self.end_headers()
+                if send_body:
+                    self.send_body(body[start:])
+
+            def send_body(self, body):
+                chunk_size = 16 * 1024
+                for offset in range(0, len(body), chunk_size):
+                    chunk = body[offset:offset + chunk_size]
+                    self.wfile.write(chunk)
+                    with cdn._lock:
+                        cdn.bytes_sent += len(chunk)
+                    if cdn.bandwidth:
+                        time.sleep(len(chunk) / cdn.bandwidth)
+
+        return Handler
+
+
+class FakeYuqueAPI:
+    """模拟语雀 OpenAPI：以录制的文档列表和详情为模板生成指定数量的文档，按 offset/limit 分页并返回 meta.total，
+    touch() 修改文档的 updated_at 和正文，模拟在语雀中编辑。记录列表和详情接口各被请求的次数"""
+
+    def __init__(self, docs=0, latency=0.0, include_total=True, token="bench-token", fixture=YUQUE_API_FIXTURE):
+        with open(fixture, 'r', encoding='utf-8') as f:
+            recorded = json.load(f)
+        self.namespace = recorded['namespace']
+        self.latency = latency
+        self.include_total = include_total
+        self.token = token
+        self.items = []
+        self.details = {}
+        templates = recorded['list']['data']
+        for index in range(docs or len(templates)):
+            template = templates[index % len(templates)]
+            item = dict(template)
+            if index >= len(templates):
+                item.update(id=template['id'] + index, slug=f"{template['slug']}-{index}",
+                            title=f"{template['title']} {index}")
+            detail = dict(recorded['details'][template['slug']]['data'],
+                          id=item['id'], slug=item['slug'], title=item['title'])
+            self.items.append(item)
+            self.details[item['slug']] = detail
+        self.list_requests = 0
+        self.doc_requests = Counter()
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.make_handler())
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_port}/api/v2/"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def touch(self, slugs):
+        """修改文档：更新 updated_at 并在正文末尾追加一行"""
+        updated_at = time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime())
+        with self._lock:
+            for slug in slugs:
+                detail = self.details[slug]
+                detail['updated_at'] = detail['content_updated_at'] = updated_at
+                detail['body'] = detail['body'] + f"\n修改于 {updated_at}（{slug}）\n"
+                for item in self.items:
+                    if item['slug'] == slug:
+                        item['updated_at'] = item['content_updated_at'] = updated_at
+
+    def make_handler(self):
+        api = self
+        docs_path = f"/api/v2/repos/{api.namespace}/docs"
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, status, payload):
+                body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.headers.get('X-Auth-Token') != api.token:
+                    self.send_json(401, {'message': "Unauthorized"})
+                    return
+                if api.latency:
+                    time.sleep(api.latency)
+                url = urlsplit(self.path)
+                query = parse_qs(url.query)
+                if url.path == docs_path:
+                    offset = int(query.get('offset', ['0'])[0])
+                    limit = int(query.get('limit', ['100'])[0])
+                    with api._lock:
+                        api.list_requests += 1
+                        page = [dict(item) for item in api.items[offset:offset + limit]]
+                    payload = {'data': page}
+                    if api.include_total:
+                        payload['meta'] = {'total': len(api.items)}
+                    self.send_json(200, payload)
+                    return
+                slug = url.path[len(docs_path) + 1:] if url.path.startswith(docs_path + '/') else None
+                with api._lock:
+                    detail = dict(api.details[slug]) if slug in api.details else None
+                    if detail is not None:
+                        api.doc_requests[slug] += 1
+                if detail is None:
+                    self.send_json(404, {'message': "Not Found"})
+                else:
+                    self.send_json(200, {'data': detail})
+
+        return Handler
+
+
+def generate_post(path, index, images, size_kb, no_type_rate, rng):
+    """生成一篇语雀风格的 Markdown：正文段落、代码块、带 #averageHue 片段的图片链接"""
+    paragraph = "语雀导出的正文内容，用于模拟真实文章的长度。Lorem ipsum dolor sit amet. " * 4 + "\n\n"
+    code_block = "```python\nprint('![not an image](https://cdn.yuque.com/code.png)')\n```\n\n"
+    image_lines = []
+    for i in range(images):
+        if rng.random() < no_type_rate:
+            url = f"raw/{index}/{i}/a1b2c3d4"
+        else:
+            url = f"yuque/0/2024/png/{index}/{i}/image.png#averageHue=%23f5f5f5&clientId=u{i}"
+        image_lines.append(f"![image.png]({url})\n\n")
+
+    body_size = max(size_kb * 1024, 1)
+    blocks = []
+    written = 0
+    while written < body_size:
+        block = rng.choice((paragraph, paragraph, code_block))
+        blocks.append(block)
+        written += len(block.encode('utf-8'))
+
+    # 图片均匀穿插在正文中
+    step = max(1, len(blocks) // max(1, images))
+    content = []
+    for i, block in enumerate(blocks):
+        content.append(block)
+        if i % step == 0 and image_lines:
+            content.append(image_lines.pop(0))
+    content.extend(image_lines)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"# 基准测试文章 {index}\n\n")
+        f.writelines(content)
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(args):
+    rng = random.Random(args.seed)
+    work_dir = Path(tempfile.mkdtemp(prefix="yuque-bench-"))
+    cdn = FakeCDN(args.latency_ms / 1000, args.bandwidth_kbps * 1024, args.error_rate,
+                  args.image_kb * 1024, args.seed).start()
+    try:
+        source_dir = work_dir / "exports"
+        source_dir.mkdir()
+        posts = []
+        for index in range(args.posts):
+            path = source_dir / f"post-{index}.md"
+            generate_post(path, index, args.images, args.size_kb, args.no_type_rate, rng)
+            posts.append(path)
+
+        cache = ImageCache(work_dir / "cache") if args.cache else None
+        failed = []
+
+        def convert(path):
+            converter = PostConverter(str(path), {'title': path.stem, 'date': '2024-01-01'}, str(work_dir / "blog"),
+                                      cdn.base_url, args.concurrency, cache, incremental=False)
+            success = converter.convert()
+            failed.extend(converter.failed_images)
+            return success
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+            results = list(executor.map(convert, posts))
+        PostManifest.flush_all()
+        wall_time = time.perf_counter() - start
+
+        total_images = args.posts * args.images
+        return {
+            'revision': git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'params': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+            'wall_time_s': round(wall_time, 3),
+            'images_per_s': round(total_images / wall_time, 2) if wall_time else None,
+            'peak_rss_kb': peak_rss_kb(),
+            'http_requests': cdn.requests,
+            'bytes_served': cdn.bytes_sent,
+            'posts_failed': results.count(False),
+            'images_failed': len(failed),
+        }
+    finally:
+        cdn.stop()
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        else:
+            print(f"工作目录: {work_dir}")
+
+
+def run_sync_benchmark(args):
+    """先完整同步一次，再修改部分文档后增量同步，返回两次同步的耗时、请求数和校验结果"""
+    rng = random.Random(args.seed)
+    work_dir = Path(tempfile.mkdtemp(prefix="yuque-bench-sync-"))
+    api = FakeYuqueAPI(args.sync_docs, args.latency_ms / 1000, include_total=not args.sync_no_total).start()
+    client = YuqueClient(api.token, api.base_url, args.concurrency, max_retries=0)
+    try:
+        def sync():
+            syncer = YuqueSync(client, api.namespace, work_dir, run_report=RunReport())
+            start = time.perf_counter()
+            synced = syncer.sync()
+            return syncer, synced, time.perf_counter() - start
+
+        first, first_docs, full_time = sync()
+        full_requests = sum(api.doc_requests.values())
+        changed = rng.sample(sorted(api.details), min(args.sync_changed, len(api.details)))
+        api.touch(changed)
+        api.doc_requests.clear()
+        second, second_docs, incremental_time = sync()
+
+        # 本地正文必须与接口中的最新内容一致
+        mismatched = [slug for slug, detail in api.details.items()
+                      if not second.doc_path(slug).exists()
+                      or second.doc_path(slug).read_text(encoding='utf-8') != detail['body']]
+        refetched = sorted(slug for slug in api.doc_requests if slug not in changed)
+        return {
+            'revision': git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'params': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+            'wall_time_s': round(full_time + incremental_time, 3),
+            'full_sync_s': round(full_time, 3),
+            'incremental_sync_s': round(incremental_time, 3),
+            'peak_rss_kb': peak_rss_kb(),
+            'http_requests': api.list_requests + full_requests + sum(api.doc_requests.values()),
+            'list_requests': api.list_requests,
+            'docs': len(api.items),
+            'docs_synced': len(second_docs),
+            'docs_changed': len(changed),
+            'docs_refetched': sum(api.doc_requests.values()),
+            'unchanged_refetched': len(refetched),
+            'docs_failed': len(first.failed) + len(second.failed) + len(mismatched),
+            'events': len(first.run_report.events) + len(second.run_report.events),
+        }
+    finally:
+        client.close()
+        api.stop()
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        else:
+            print(f"工作目录: {work_dir}")
+
+
+def compare(current, baseline_path):
+    """与之前保存的结果对比，输出主要指标的变化"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"\n对比 {baseline_path}（{baseline.get('revision')} → {current.get('revision')}）")
+    for key in ('wall_time_s', 'images_per_s', 'peak_rss_kb', 'http_requests'):
+        old, new = baseline.get(key), current.get(key)
+        if old and new is not None:
+            print(f"  {key:15} {old:>12} → {new:<12} ({(new - old) / old * 100:+.1f}%)")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="yuque-to-hexo 离线基准测试")
+    parser.add_argument('--posts', type=int, default=3, help="生成的文章数")
+    parser.add_argument('--images', type=int, default=50, help="每篇文章的图片数")
+    parser.add_argument('--size-kb', type=int, default=200, help="每篇文章正文的大致大小（KB）")
+    parser.add_argument('--image-kb', type=int, default=50, help="每张图片的大小（KB）")
+    parser.add_argument('--latency-ms', type=float, default=30, help="模拟 CDN 的响应延迟（毫秒）")
+    parser.add_argument('--bandwidth-kbps', type=int, default=0, help="每个连接的带宽上限（KB/s），0 表示不限")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="返回 503 的概率")
+    parser.add_argument('--no-type-rate', type=float, default=0.1, help="缺少 Content-Type 和扩展名的图片比例")
+    parser.add_argument('--concurrency', type=int, default=8, help="每篇文章的并发下载数")
+    parser.add_argument('--jobs', type=int, default=1, help="同时转换的文章数")
+    parser.add_argument('--cache', action='store_true', help="启用图片缓存")
+    parser.add_argument('--seed', type=int, default=0, help="随机种子，保证结果可复现")
+    parser.add_argument('--keep', action='store_true', help="保留生成的工作目录")
+    parser.add_argument('--sync', action='store_true', help="改为测试通过模拟语雀 OpenAPI 同步知识库")
+    parser.add_argument('--sync-docs', type=int, default=250, help="模拟知识库中的文档数（超过一页时分页获取）")
+    parser.add_argument('--sync-changed', type=int, default=10, help="第二次同步前修改的文档数")
+    parser.add_argument('--sync-no-total', action='store_true', help="列表接口不返回 meta.total，逐页获取")
+    parser.add_argument('--output', default=None, help="将结果保存为 JSON 文件")
+    parser.add_argument('--compare', default=None, help="与之前保存的 JSON 结果对比")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    result = run_sync_benchmark(args) if args.sync else run_benchmark(args)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        compare(result, args.compare)
+    if args.sync:
+        return 1 if result['docs_failed'] or result['unchanged_refetched'] else 0
+    return 1 if result['posts_failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,435 @@
+# -*- coding: utf-8 -*-
+"""命令行批量转换，不依赖 PyQt5，可在构建服务器上运行
+
+示例:
+    python yuque_cli.py exports/ --root /path/to/blog --prefix https://cdn.yuque.com/ --jobs 4
+    python yuque_cli.py 知识库.zip --root /path/to/blog
+    python yuque_cli.py inbox/ --root /path/to/blog --watch
+    python yuque_cli.py --gc --root /path/to/blog
+    python yuque_cli.py --namespace user/book --token $YUQUE_TOKEN --root /path/to/blog
+
+每篇文章的 Front Matter 可以放在同名的 <文件名>.meta.json 中，未提供的字段使用 --defaults 指定的
+JSON 文件或命令行参数中的默认值。语雀导出的 .zip 压缩包无需解压，知识库目录结构作为分类追加。
+指定 --namespace 时通过语雀 OpenAPI 同步整个知识库，只拉取 updated_at 有变化的文档。
+只要有任何文章或图片处理失败，退出码即为 1。
+"""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import threading
+from datetime import date
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from yuque_core import (
+    DEFAULT_OPTIMIZE_OPTIONS, YUQUE_API_BASE, AssetStore, DirectoryWatcher, ImageCache, PostConverter, PostManifest,
+    RunReport, SearchIndex, YuqueArchive, YuqueClient, YuqueSync, create_optimize_pool, localize_pending_posts,
+    retry_failed_posts
+)
+
+SIDECAR_SUFFIX = ".meta.json"
+
+
+def collect_markdown_files(patterns, suffix='.md'):
+    """展开目录和通配符，返回去重后的 .md（或指定扩展名）文件列表"""
+    files = []
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            matches = sorted(path.rglob(f'*{suffix}'))
+        else:
+            matches = sorted(Path(p) for p in glob.glob(pattern, recursive=True))
+        files.extend(p.resolve() for p in matches if p.suffix.lower() == suffix and p.is_file())
+    return list(dict.fromkeys(files))
+
+
+def load_front_matter(md_path, defaults):
+    """合并默认值与同名 sidecar 文件中的 Front Matter；默认日期取源文件的修改日期而不是今天，
+    否则 Front Matter 每天都会变化，增量转换会重新处理所有文章并改写已发布文章的日期"""
+    front_matter = {
+        'title': md_path.stem,
+        'date': date.fromtimestamp(md_path.stat().st_mtime).isoformat(),
+        'categories': [],
+        'tags': [],
+    }
+    front_matter.update(defaults)
+    sidecar = md_path.with_name(md_path.stem + SIDECAR_SUFFIX)
+    if sidecar.exists():
+        with open(sidecar, 'r', encoding='utf-8') as f:
+            front_matter.update(json.load(f))
+    if front_matter.get('title') is None:
+        front_matter['title'] = md_path.stem
+    return front_matter
+
+
+def archive_front_matter(archive, member, defaults):
+    """压缩包中的文档：标题取文档名，知识库目录追加为层级分类，默认日期取成员的修改日期"""
+    front_matter = {'date': date.fromtimestamp(archive.mtime(member)).isoformat(), 'categories': [], 'tags': []}
+    front_matter.update(defaults)
+    front_matter['title'] = Path(member).stem
+    front_matter['categories'] = list(front_matter.get('categories') or []) + archive.categories(member)
+    return front_matter
+
+
+def convert_file(md_path, front_matter, options, archive_path=None, cancelled=None):
+    """在工作线程中转换单个文件（或压缩包中的一篇文档），返回结果摘要；
+    所有文件在同一进程中转换，共用每个图片主机的并发上限与限流状态"""
+    name = Path(md_path).name
+
+    def report(message, percent):
+        if not options['quiet']:
+            print(f"[{name}] {message}", flush=True)
+
+    run_report = RunReport()
+    # 同一压缩包只读取一次目录
+    archive = YuqueArchive.for_path(archive_path) if archive_path else None
+    converter = PostConverter(str(md_path), front_matter, options['root'], options['prefix'],
+                              options['concurrency'], options['cache'], options['incremental'], progress=report,
+                              max_retries=options['retries'], optimize_options=options['optimize'],
+                              run_report=run_report, archive=archive, shared_assets=options['shared_assets'],
+                              search_index=options['search_index'], lazy_images=options['lazy_images'],
+                              optimize_pool=options['optimize_pool'])
+    if cancelled is not None:
+        converter.cancelled = cancelled
+    success = converter.convert()
+    return {
+        'file': converter.md_path,
+        'success': success,
+        'skipped': converter.skipped,
+        'failed_images': list(converter.failed_images),
+        'events': run_report.events,
+    }
+
+
+def localize_queue(options, cancelled=None):
+    """处理博客的图片下载队列（--lazy-images），返回 (下载失败的图片数, 事件列表)"""
+    def report(message, percent):
+        if not options['quiet']:
+            print(message, flush=True)
+
+    run_report = RunReport()
+    remaining = localize_pending_posts(options['root'], options['prefix'], options['concurrency'], options['cache'],
+                                       progress=report, run_report=run_report,
+                                       shared_assets=options['shared_assets'], cancelled=cancelled,
+                                       optimize_options=options['optimize'], optimize_pool=options['optimize_pool'])
+    return remaining, run_report.events
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="将语雀导出的 Markdown 批量转换为 Hexo 文章（无界面模式）")
+    parser.add_argument('inputs', nargs='*', help="Markdown 文件、目录、通配符（如 'exports/**/*.md'）或语雀导出的 .zip")
+    parser.add_argument('--root', default=None, help="博客根目录，留空则输出到 md 文件所在目录")
+    parser.add_argument('--prefix', default="https://cdn.yuque.com/", help="图片URL前缀，用于修复无协议头的链接")
+    parser.add_argument('--jobs', type=int, default=2, help="同时处理的文件数（线程数）")
+    parser.add_argument('--concurrency', type=int, default=8, help="每个文件的并发下载数")
+    parser.add_argument('--defaults', default=None, help="默认 Front Matter 的 JSON 文件")
+    parser.add_argument('--categories', default='', help="默认分类（逗号分隔，层级分类）")
+    parser.add_argument('--tags', default='', help="默认标签（逗号分隔）")
+    parser.add_argument('--cache-dir', default="image_cache", help="图片缓存目录，传空字符串禁用缓存")
+    parser.add_argument('--no-incremental', action='store_true', help="忽略清单，强制重新处理全部文件")
+    parser.add_argument('--retries', type=int, default=3, help="超时、5xx、429 时的最大重试次数")
+    parser.add_argument('--retry-failed', action='store_true',
+                        help="只重试失败日志中的图片并修正已写出的文章（需要 --root）")
+    parser.add_argument('--optimize', action='store_true', help="下载后在进程池中压缩图片（需要 Pillow）")
+    parser.add_argument('--max-width', type=int, default=DEFAULT_OPTIMIZE_OPTIONS['max_width'],
+                        help="压缩时的最大宽度，0 表示不缩放")
+    parser.add_argument('--quality', type=int, default=DEFAULT_OPTIMIZE_OPTIONS['quality'], help="压缩质量 1-100")
+    parser.add_argument('--format', choices=['keep', 'webp'], default='keep', help="压缩后的输出格式")
+    parser.add_argument('--report', default=None, help="将结构化事件（阶段耗时、每张图片的 DNS/连接/首字节/传输耗时）"
+                                                       "写入 JSONL 运行报告")
+    parser.add_argument('--trace', default=None, help="同时导出 Chrome trace 文件（chrome://tracing / Perfetto）")
+    parser.add_argument('--shared-assets', action='store_true',
+                        help="相同内容的图片只在 source/.yuque-to-hexo-assets 中保存一份，文章图片文件夹中使用硬链接"
+                             "（不支持时 reflink 或复制）")
+    parser.add_argument('--gc', action='store_true', help="删除共享图片库中不再被任何文章引用的图片（需要 --root）")
+    parser.add_argument('--lazy-images', action='store_true',
+                        help="先写出保留原始图片链接的文章，再按队列下载图片并替换链接；中断后再次运行会继续"
+                             "（不指定输入文件时只处理队列，需要 --root）")
+    parser.add_argument('--search-index', action='store_true',
+                        help="转换后就地更新 public 下 hexo-generator-search 的 search.xml / search.json，"
+                             "无需重新 hexo generate")
+    parser.add_argument('--watch', action='store_true',
+                        help="持续监视输入目录，新增或修改的 .md / .zip 写入完成后自动转换（Ctrl+C 退出）")
+    parser.add_argument('--interval', type=float, default=1.0, help="监视模式的轮询间隔（秒）")
+    parser.add_argument('--debounce', type=float, default=2.0, help="文件多少秒内不再变化才开始转换")
+    parser.add_argument('--namespace', default=None, help="通过语雀 OpenAPI 同步的知识库（如 user/book）")
+    parser.add_argument('--token', default=os.environ.get('YUQUE_TOKEN'),
+                        help="语雀 OpenAPI Token，默认读取环境变量 YUQUE_TOKEN")
+    parser.add_argument('--api-base', default=YUQUE_API_BASE, help="语雀 OpenAPI 地址（私有部署或测试时修改）")
+    parser.add_argument('--sync-dir', default="yuque_sync", help="同步下来的文档正文保存目录")
+    parser.add_argument('--quiet', action='store_true', help="只输出最终汇总")
+    return parser.parse_args(argv)
+
+
+def retry_failed(args):
+    """仅重试失败图片模式"""
+    if not args.root:
+        print("❌ --retry-failed 需要指定 --root", file=sys.stderr)
+        return 2
+
+    def report(message, percent):
+        if not args.quiet:
+            print(message, flush=True)
+
+    cache = ImageCache(args.cache_dir) if args.cache_dir else None
+    run_report = RunReport()
+    remaining = retry_failed_posts(args.root, args.prefix.strip(), args.concurrency, cache, progress=report,
+                                   run_report=run_report, shared_assets=args.shared_assets)
+    write_reports(run_report, args)
+    print(f"\n重试结束，仍有 {remaining} 张图片下载失败")
+    return 1 if remaining else 0
+
+
+def collect_garbage(args):
+    """清理共享图片库"""
+    if not args.root:
+        print("❌ --gc 需要指定 --root", file=sys.stderr)
+        return 2
+    posts_dir = Path(args.root) / "source" / "_posts"
+    if not (posts_dir.parent / AssetStore.DIR_NAME).is_dir():
+        print("共享图片库不存在，无需清理")
+        return 0
+    removed, freed = AssetStore.for_posts_dir(posts_dir).gc(posts_dir)
+    print(f"🧹 已删除 {removed} 个未被引用的图片，释放 {freed / 1024:.1f} KB")
+    return 0
+
+
+def write_reports(run_report, args):
+    """按参数导出运行报告与 Chrome trace"""
+    if args.report:
+        run_report.write_jsonl(args.report)
+        print(f"📊 运行报告: {args.report}")
+    if args.trace:
+        run_report.write_chrome_trace(args.trace)
+        print(f"📊 Chrome trace: {args.trace}")
+
+
+def watch_tasks(path, defaults, options):
+    """监视到的文件对应的转换任务：md 文件一项，压缩包中每篇文档各一项，返回 [(标识, 参数)]"""
+    if path.suffix.lower() != '.zip':
+        return [(str(path), (path, load_front_matter(path, defaults), options))]
+    try:
+        archive = YuqueArchive.for_path(path)
+    except Exception as e:
+        print(f"❌ 无法读取压缩包 {path}: {str(e)}", flush=True)
+        return []
+    return [(archive.virtual_path(member), (member, archive_front_matter(archive, member, defaults), options,
+                                            archive.path))
+            for member in archive.posts]
+
+
+def watch(args, defaults, options):
+    """监视模式：稳定后的新文件交给线程池转换；同一文件转换期间再次修改时，结束后再转换一次"""
+    directories = [pattern for pattern in args.inputs if Path(pattern).is_dir()]
+    if not directories:
+        print("❌ --watch 需要指定至少一个目录", file=sys.stderr)
+        return 2
+
+    watcher = DirectoryWatcher(directories, args.interval, args.debounce)
+    running = {}
+    rerun = {}
+    localizing = None
+    queued = options['lazy_images']
+    cancelled = threading.Event()
+    print(f"👀 正在监视: {', '.join(directories)}（Ctrl+C 退出）", flush=True)
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        def submit(key, task):
+            if key in running.values():
+                rerun[key] = task
+            else:
+                running[executor.submit(convert_file, *task, cancelled=cancelled)] = key
+
+        try:
+            while True:
+                for path in watcher.poll():
+                    for key, task in watch_tasks(Path(path).resolve(), defaults, options):
+                        submit(key, task)
+                for future in [future for future in running if future.done()]:
+                    key = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        print(f"❌ {key}: {str(e)}", flush=True)
+                    else:
+                        failed = len(result['failed_images'])
+                        if not result['skipped']:
+                            status = '✅' if result['success'] else '❌'
+                            print(f"{status} {key}" + (f"（图片下载失败 {failed}）" if failed else ""), flush=True)
+                            queued = queued or options['lazy_images']
+                    if key in rerun:
+                        submit(key, rerun.pop(key))
+                # 先写出的文章由一个任务按队列顺序下载图片，同一时间只运行一个
+                if localizing and localizing.done():
+                    localizing = None
+                if queued and not localizing:
+                    localizing = executor.submit(localize_queue, options, cancelled)
+                    queued = False
+                if not running and not localizing:
+                    # 空闲时不占用压缩包，否则 Windows 上导出工具无法替换它；缓存的搜索索引条目也在此时写回
+                    YuqueArchive.release_all()
+                    for error in SearchIndex.flush_all():
+                        print(f"⚠️ 搜索索引更新失败: {error}", file=sys.stderr)
+                time.sleep(args.interval)
+        except KeyboardInterrupt:
+            print("\n🛑 已停止监视")
+            # 工作线程不会收到 Ctrl+C，通知正在转换的文章取消
+            cancelled.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+    return 0
+
+
+def sync_namespace(args, defaults, run_report=None):
+    """同步知识库，返回 ([(md 路径, Front Matter)], 获取失败的文档 slug)"""
+    def report(message, percent):
+        if not args.quiet:
+            print(message, flush=True)
+
+    client = YuqueClient(args.token, args.api_base, args.concurrency, args.retries)
+    try:
+        sync = YuqueSync(client, args.namespace, args.sync_dir, progress=report, run_report=run_report)
+        docs = sync.sync()
+    finally:
+        client.close()
+    tasks = []
+    for md_path, front_matter in docs:
+        merged = {'categories': [], 'tags': []}
+        merged.update(defaults)
+        merged.update(front_matter)
+        tasks.append((md_path, merged))
+    return tasks, sync.failed
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.retry_failed:
+        return retry_failed(args)
+    if args.gc:
+        return collect_garbage(args)
+    files = collect_markdown_files(args.inputs)
+    archives = collect_markdown_files(args.inputs, suffix='.zip')
+    if args.namespace and not args.token:
+        print("❌ --namespace 需要 --token 或环境变量 YUQUE_TOKEN", file=sys.stderr)
+        return 2
+    if args.lazy_images and not args.root:
+        print("❌ --lazy-images 需要指定 --root", file=sys.stderr)
+        return 2
+    if not files and not archives and not args.watch and not args.namespace and not args.lazy_images:
+        print("❌ 未找到任何 .md 文件", file=sys.stderr)
+        return 2
+
+    defaults = {}
+    if args.defaults:
+        with open(args.defaults, 'r', encoding='utf-8') as f:
+            defaults = json.load(f)
+    categories = [x.strip() for x in args.categories.split(',') if x.strip()]
+    tags = [x.strip() for x in args.tags.split(',') if x.strip()]
+    if categories:
+        defaults['categories'] = categories
+    if tags:
+        defaults['tags'] = tags
+
+    if args.root:
+        Path(args.root).mkdir(parents=True, exist_ok=True)
+    options = {
+        'root': args.root,
+        'prefix': args.prefix.strip(),
+        'concurrency': args.concurrency,
+        # 所有工作线程共用一个缓存实例
+        'cache': ImageCache(args.cache_dir) if args.cache_dir else None,
+        'incremental': not args.no_incremental,
+        'retries': args.retries,
+        'shared_assets': args.shared_assets,
+        'search_index': args.search_index,
+        'lazy_images': args.lazy_images,
+        'optimize': {
+            'max_width': args.max_width,
+            'quality': args.quality,
+            'format': None if args.format == 'keep' else args.format,
+        } if args.optimize else None,
+        'quiet': args.quiet,
+    }
+    # 所有工作线程共用一个压缩进程池，不为每篇文章重新启动子进程
+    options['optimize_pool'] = create_optimize_pool(options['optimize'])
+    try:
+        if args.watch:
+            return watch(args, defaults, options)
+        return convert_all(args, defaults, files, archives, options)
+    finally:
+        if options['optimize_pool']:
+            options['optimize_pool'].shutdown()
+
+
+def convert_all(args, defaults, files, archives, options):
+    """转换全部输入（含同步的知识库和压缩包），输出汇总，返回退出码"""
+    results = []
+    run_report = RunReport()
+    tasks = [(md_path, load_front_matter(md_path, defaults)) for md_path in files]
+    if args.namespace:
+        try:
+            synced, failed_docs = sync_namespace(args, defaults, run_report)
+        except Exception as e:
+            print(f"❌ 同步知识库失败: {str(e)}", file=sys.stderr)
+            return 1
+        tasks.extend(synced)
+        results.extend({'file': f"{args.namespace}/{slug}", 'success': False, 'skipped': False,
+                        'failed_images': [], 'error': "获取文档失败"} for slug in failed_docs)
+
+    cancelled = threading.Event()
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        futures = {executor.submit(convert_file, md_path, front_matter, options, cancelled=cancelled): md_path
+                   for md_path, front_matter in tasks}
+        for archive_path in archives:
+            try:
+                archive = YuqueArchive.for_path(archive_path)
+            except Exception as e:
+                results.append({'file': str(archive_path), 'success': False, 'skipped': False,
+                                'failed_images': [], 'error': str(e)})
+                continue
+            for member in archive.posts:
+                future = executor.submit(convert_file, member, archive_front_matter(archive, member, defaults),
+                                         options, archive.path, cancelled)
+                futures[future] = archive.virtual_path(member)
+        try:
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                    run_report.extend(result.pop('events'))
+                    results.append(result)
+                except Exception as e:
+                    results.append({'file': str(futures[future]), 'success': False, 'skipped': False,
+                                    'failed_images': [], 'error': str(e)})
+        except KeyboardInterrupt:
+            # 工作线程不会收到 Ctrl+C，通知正在转换的文章取消，尚未开始的不再执行
+            print("\n🛑 已取消，等待正在处理的文件结束", flush=True)
+            cancelled.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+            return 1
+
+    # 所有文章的文字都已写出，再按队列顺序下载图片（包括上次中断留下的）
+    queue_failed = 0
+    if args.lazy_images:
+        queue_failed, events = localize_queue(options, cancelled)
+        run_report.extend(events)
+    PostManifest.flush_all()
+    for error in SearchIndex.flush_all():
+        print(f"⚠️ 搜索索引更新失败: {error}", file=sys.stderr)
+
+    write_reports(run_report, args)
+    failed_files = [r for r in results if not r['success']]
+    failed_images = sum(len(r['failed_images']) for r in results) + queue_failed
+    skipped = sum(1 for r in results if r['skipped'])
+    print(f"\n共 {len(results)} 个文件: 转换 {len(results) - skipped - len(failed_files)}，"
+          f"跳过 {skipped}，失败 {len(failed_files)}，图片下载失败 {failed_images}")
+    for result in results:
+        if not result['success']:
+            print(f"❌ {result['file']}: {result.get('error', '处理失败')}")
+        for url in result['failed_images']:
+            print(f"⚠️ {result['file']}: {url}")
+    return 1 if failed_files or failed_images else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
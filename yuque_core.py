@@ -0,0 +1,2424 @@
+# -*- coding: utf-8 -*-
+"""转换核心：不依赖 PyQt5，可被图形界面和命令行共同使用"""
+import io
+import os
+import re
+import json
+import time
+import atexit
+import shutil
+import random
+import hashlib
+import zipfile
+import email.utils
+import tempfile
+import posixpath
+import threading
+import xml.etree.ElementTree as ElementTree
+import urllib.parse
+from pathlib import Path, PurePosixPath
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+# Content-Type 与扩展名的对应关系
+CONTENT_TYPE_EXTENSIONS = {
+    'image/png': '.png',
+    'image/jpeg': '.jpeg',
+    'image/jpg': '.jpeg',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+    'image/svg+xml': '.svg',
+}
+
+# 需要退避重试的 HTTP 状态码
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+
+# 语雀 OpenAPI
+YUQUE_API_BASE = "https://www.yuque.com/api/v2/"
+YUQUE_PAGE_SIZE = 100
+
+# 每个主机的自适应并发上限（AIMD）
+HOST_INITIAL_LIMIT = 4
+HOST_MIN_LIMIT = 1
+HOST_MAX_LIMIT = 32
+CONNECT_TIMEOUT = 5
+
+# 清单类文件（增量清单、失败日志、图片队列）写回磁盘的最小间隔（秒），期间的修改合并为一次写入
+MANIFEST_SAVE_INTERVAL = 5.0
+
+# 下载写入：每个线程复用一块缓冲区，读取块从 64 KB 起按需增大到整块缓冲区；开始下载前至少保留的磁盘空间
+DOWNLOAD_BUFFER_SIZE = 1024 * 1024
+DOWNLOAD_MIN_CHUNK = 64 * 1024
+DISK_SPACE_RESERVE = 16 * 1024 * 1024
+
+# 图片优化默认参数（format 为 None 时保持原格式，"webp" 时转换为 WebP）
+DEFAULT_OPTIMIZE_OPTIONS = {
+    'max_width': 1600,
+    'quality': 80,
+    'format': None,
+    'workers': os.cpu_count() or 2,
+}
+OPTIMIZABLE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.webp'}
+OPTIMIZE_SIDECAR = ".optimized.json"
+
+
+# 结构化事件的日志模板；没有模板的事件（如 stage）只写入运行报告
+EVENT_MESSAGES = {
+    'prefix_added': "补充 URL 前缀: {url} -> {download_url}",
+    'image_done': lambda e: (f"✅ 下载成功: {e['file']}"
+                             + (f"（{format_size(e['bytes'])}，{format_size(e['throughput'])}/s）"
+                                if e.get('throughput') else "")),
+    'image_failed': "❌ 下载失败: {error} for {download_url}",
+    'image_updated': "🔄 图片已更新: {file}",
+    'revalidate_failed': "⚠️ 重新验证失败: {error}，保留本地文件 {file}",
+    'retry': "🔁 {delay:.1f}s 后第 {attempt} 次重试（{error}）: {download_url}",
+    'resume': "⏩ 从 {offset} 字节处续传: {download_url}",
+    'images_failed': "⚠️ 警告: {count} 张图片下载失败，原始路径已保留",
+    'cache_stats': lambda e: (f"📦 缓存统计: 命中 {e['hits']}，未命中 {e['misses']}，"
+                              f"节省 {e['bytes_saved'] / 1024:.1f} KB"),
+    'optimize_unavailable': "⚠️ 未安装 Pillow，跳过图片优化（pip install Pillow）",
+    'optimize_failed': "⚠️ 图片优化失败: {file} ({error})",
+    'optimize_done': lambda e: (f"🗜️ 图片优化: {e['count']} 张待处理，"
+                                f"节省 {(e['bytes_before'] - e['bytes_after']) / 1024:.1f} KB "
+                                f"({e['bytes_before'] / 1024:.1f} KB → {e['bytes_after'] / 1024:.1f} KB)"),
+    'skipped': lambda e: (f"⏭️ 内容未变化，跳过: {e['post']}" if e['reason'] == 'content'
+                          else f"⏭️ 未修改，跳过: {e['post']}"),
+    'cancelled': "🛑 已取消: {post}",
+    'error': "💥 处理失败: {error}",
+    'output_missing': "⚠️ 文章不存在，无法修正: {output}",
+    'retry_failed': "🔁 重试 {count} 张失败图片: {output}",
+    'images_queued': "📝 已先写出文章（{count} 张图片稍后下载）: {output}",
+    'localize': "🖼️ 下载 {count} 张图片并更新文章: {output}",
+    'assets_linked': "🔗 共享图片库: 硬链接 {hardlink}，reflink {reflink}，复制 {copy}",
+    'sync_listed': "📚 {namespace}: 共 {total} 篇文档，{changed} 篇有更新",
+    'doc_fetched': "⬇️ 已获取: {title}",
+    'doc_failed': "❌ 获取文档失败: {title} ({error})",
+    'search_indexed': "🔎 已加入搜索索引（本批转换结束时写入）: {url}",
+    'search_index_failed': "⚠️ 搜索索引更新失败: {error}",
+    'throttled': lambda e: (f"🐢 {e['host']} {e['reason']}，并发上限降至 {e['limit']:.1f}"
+                            + (f"，{e['retry_after']:.0f}s 后再请求" if e['retry_after'] else "")),
+    'host_limits': lambda e: (f"🚦 {e['host']}: 并发上限 {e['limit']:.1f}，"
+                              f"平均延迟 {e['latency_ms'] or 0:.0f} ms（最低 {e['base_latency_ms'] or 0:.0f} ms），"
+                              f"请求 {e['requests']} 次，限流 {e['throttled']} 次"),
+}
+
+
+def format_size(size):
+    return f"{size / 1024 / 1024:.1f} MB" if size >= 1024 * 1024 else f"{size / 1024:.1f} KB"
+
+
+def render_event(event):
+    """把结构化事件渲染为日志文字，没有模板时返回 None"""
+    template = EVENT_MESSAGES.get(event['type'])
+    if template is None:
+        return None
+    return template(event) if callable(template) else template.format(**event)
+
+
+def emit_event(run_report, progress, post, event_type, percent=None, **fields):
+    """记录一条结构化事件到运行报告；有日志模板的事件同时渲染成文字交给进度回调。
+    PostConverter 与 YuqueSync 都通过这里生成事件，保证字段一致"""
+    event = {'type': event_type, 'post': post, 'ts': time.time(),
+             'pid': os.getpid(), 'thread': threading.get_ident()}
+    event.update(fields)
+    if percent is not None:
+        event['percent'] = percent
+    if run_report is not None:
+        run_report.record(event)
+    message = render_event(event)
+    if message is not None and progress:
+        progress(message, percent or 0)
+
+
+class RunReport:
+    """收集一次运行中的所有结构化事件，可导出为 JSONL 报告或 Chrome trace"""
+
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+
+    def record(self, event):
+        with self._lock:
+            self.events.append(event)
+
+    def extend(self, events):
+        with self._lock:
+            self.events.extend(events)
+
+    def write_jsonl(self, path):
+        """每行一个事件，便于用 jq / pandas 分析"""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            events = list(self.events)
+        with open(path, 'w', encoding='utf-8') as f:
+            for event in events:
+                f.write(json.dumps(event, ensure_ascii=False) + '\n')
+
+    def write_chrome_trace(self, path):
+        """导出带耗时的事件（阶段、单张图片），可在 chrome://tracing 或 Perfetto 中查看"""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            events = [event for event in self.events if 'duration' in event]
+        trace = []
+        for event in events:
+            name = event.get('name') or event.get('file') or event.get('url') or event['type']
+            args = {key: value for key, value in event.items() if key not in ('ts', 'pid', 'thread')}
+            trace.append({
+                'name': name,
+                'cat': f"{event['type']},{event['post']}",
+                'ph': 'X',
+                'ts': (event['ts'] - event['duration']) * 1e6,
+                'dur': event['duration'] * 1e6,
+                'pid': event['pid'],
+                'tid': event['thread'],
+                'args': args,
+            })
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+
+
+def backoff_delay(attempt):
+    """带随机抖动的指数退避"""
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** (attempt - 1)))
+    return delay * random.uniform(0.5, 1.5)
+
+
+_download_buffers = threading.local()
+
+
+def download_buffer():
+    """当前线程复用的下载缓冲区"""
+    buffer = getattr(_download_buffers, 'view', None)
+    if buffer is None:
+        buffer = _download_buffers.view = memoryview(bytearray(DOWNLOAD_BUFFER_SIZE))
+    return buffer
+
+
+def ensure_disk_space(directory, size):
+    """剩余空间不足以写入 size 字节（外加保留空间）时抛出 OSError，避免写到一半才失败"""
+    free = shutil.disk_usage(directory).free
+    if free < size + DISK_SPACE_RESERVE:
+        raise OSError(f"磁盘空间不足: 剩余 {free / 1024 / 1024:.1f} MB，需要 {size / 1024 / 1024:.1f} MB")
+
+
+def preallocate(f, offset, length):
+    """为 offset 之后的 length 字节预先分配空间，失败时忽略（只影响碎片和提前发现空间不足）。
+    posix_fallocate 只在 POSIX 系统上存在；Windows 等平台用 truncate 把文件扩展到最终大小，
+    NTFS 会为扩展的部分预留磁盘簇"""
+    try:
+        if hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(f.fileno(), offset, length)
+        else:
+            f.truncate(offset + length)
+    except OSError:
+        pass
+
+
+def stream_to_file(response, path, offset=0):
+    """把流式响应体直接读入线程复用的缓冲区再写入文件（offset > 0 时追加到续传位置之后），
+    不为每个数据块分配新的 bytes 对象。已知 Content-Length 时预先分配文件空间。
+    返回 (写入的字节数, 本次响应的前 1 KB 用于识别文件类型)"""
+    from yuque_http import read_into
+    raw = response.raw
+    raw.decode_content = True
+    length = response.headers.get('Content-Length')
+    # 压缩传输时 Content-Length 是压缩后的长度，无法用于预分配
+    length = int(length) if length and length.isdigit() and not response.headers.get('Content-Encoding') else None
+    ensure_disk_space(path.parent, length or 0)
+
+    buffer = download_buffer()
+    chunk_size = DOWNLOAD_MIN_CHUNK
+    written = 0
+    head = b''
+    # 续传时不能用追加模式：预分配会把文件扩展到最终大小，追加写入会落到末尾之后
+    with open(path, 'r+b' if offset else 'wb', buffering=0) as f:
+        f.seek(offset)
+        if length:
+            preallocate(f, offset, length)
+        try:
+            while True:
+                n = read_into(raw, buffer[:chunk_size])
+                if not n:
+                    break
+                if not head:
+                    head = bytes(buffer[:min(n, 1024)])
+                f.write(buffer[:n])
+                written += n
+                # 一次读满说明数据来得比处理快，增大读取块以减少 Python 层的循环次数
+                if n == chunk_size and chunk_size < len(buffer):
+                    chunk_size = min(chunk_size * 2, len(buffer))
+        finally:
+            # 下载中断时去掉预分配的尾部，使续传从真实写入的位置开始
+            f.truncate(offset + written)
+    return written, head
+
+
+def parse_retry_after(value):
+    """解析 Retry-After（秒数或 HTTP 日期），返回秒数，无法解析时返回 None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class HostLimiter:
+    """单个主机的自适应并发上限（AIMD）：延迟健康时每个往返约增加 1 个并发，
+    429/5xx、超时和连接错误时减半，并遵守 Retry-After；同一进程内所有转换共用"""
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, host, initial=HOST_INITIAL_LIMIT, maximum=HOST_MAX_LIMIT):
+        self.host = host
+        self.limit = float(initial)
+        self.maximum = maximum
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.latency = None
+        self.base_latency = None
+        self.last_decrease = 0.0
+        self.requests = 0
+        self.throttled = 0
+        self._cond = threading.Condition()
+
+    @classmethod
+    def for_url(cls, url):
+        host = urllib.parse.urlsplit(url).netloc.lower()
+        with cls._instances_lock:
+            if host not in cls._instances:
+                cls._instances[host] = cls(host)
+            return cls._instances[host]
+
+    def read_timeout(self):
+        """读取超时随平均延迟放宽，慢主机不会因固定超时而反复重试"""
+        return max(10.0, min(60.0, (self.latency or 0.0) * 8))
+
+    def acquire(self, cancelled=None):
+        """等待可用的并发名额（以及 Retry-After 暂停结束），取消时返回 False"""
+        with self._cond:
+            while True:
+                if cancelled is not None and cancelled.is_set():
+                    return False
+                wait = self.paused_until - time.monotonic()
+                if wait <= 0 and self.in_flight < max(HOST_MIN_LIMIT, int(self.limit)):
+                    self.in_flight += 1
+                    return True
+                self._cond.wait(min(0.5, wait) if wait > 0 else 0.5)
+
+    def release(self, latency=None, status=None, retry_after=None, failed=False):
+        """归还名额并根据本次请求的结果调整上限，降速时返回 True"""
+        now = time.monotonic()
+        with self._cond:
+            self.in_flight -= 1
+            self.requests += 1
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+            congested = failed or status is None or status in RETRY_STATUS_CODES
+            decreased = False
+            if congested:
+                # 同一往返内的多个失败只减半一次
+                if now - self.last_decrease >= (self.latency or 1.0):
+                    self.limit = max(float(HOST_MIN_LIMIT), self.limit / 2)
+                    self.last_decrease = now
+                    self.throttled += 1
+                    decreased = True
+            elif latency is not None:
+                self.latency = latency if self.latency is None else self.latency * 0.8 + latency * 0.2
+                self.base_latency = latency if self.base_latency is None else min(self.base_latency, latency)
+                # 延迟没有明显上升时加性增加
+                if self.latency <= self.base_latency * 2 + 0.05:
+                    self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+            self._cond.notify_all()
+            return decreased
+
+    def stats(self):
+        with self._cond:
+            return {
+                'host': self.host,
+                'limit': self.limit,
+                'latency_ms': self.latency * 1000 if self.latency is not None else None,
+                'base_latency_ms': self.base_latency * 1000 if self.base_latency is not None else None,
+                'requests': self.requests,
+                'throttled': self.throttled,
+            }
+
+
+class PostManifest:
+    """记录每篇源文件的内容哈希、修改时间、图片集合及其 ETag/Last-Modified，用于增量转换。
+    修改先保存在内存中，最多每 MANIFEST_SAVE_INTERVAL 秒写回一次，运行结束时由 flush_all() 写回"""
+
+    FILE_NAME = ".yuque-to-hexo-manifest.json"
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.posts = self.load()
+        # 尚未写回的修改（None 表示删除），写回时只把这些条目合并到磁盘上的最新内容
+        self.dirty = {}
+        self.last_save = 0.0
+        self._timer = None
+
+    def load(self):
+        try:
+            if self.path.exists():
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    return json.load(f).get('posts', {})
+        except (OSError, ValueError):
+            pass
+        return {}
+
+    @classmethod
+    def for_posts_dir(cls, posts_dir):
+        """同一博客共用一个清单实例（保存在 source/_posts 旁边），避免并发线程互相覆盖"""
+        path = (Path(posts_dir).parent / cls.FILE_NAME).resolve()
+        with cls._instances_lock:
+            if path not in cls._instances:
+                cls._instances[path] = cls(path)
+            return cls._instances[path]
+
+    @staticmethod
+    def hash_text(text):
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get(self, source_path):
+        with self._lock:
+            return self.posts.get(str(Path(source_path).resolve()))
+
+    def update(self, source_path, entry):
+        """更新单篇文章的记录，按间隔批量写回磁盘"""
+        with self._lock:
+            key = str(Path(source_path).resolve())
+            self.posts[key] = entry
+            self.dirty[key] = entry
+            self.schedule_save()
+
+    def remove(self, source_path):
+        with self._lock:
+            key = str(Path(source_path).resolve())
+            if self.posts.pop(key, None) is not None:
+                self.dirty[key] = None
+                self.schedule_save()
+
+    def entries(self):
+        """写回尚未保存的修改后返回全部记录（含其他进程写入的）"""
+        with self._lock:
+            if self.dirty:
+                self.write_changes()
+            else:
+                self.posts = self.load()
+            return dict(self.posts)
+
+    def schedule_save(self):
+        """距上次写回已超过间隔时立即写回，否则在间隔结束时写回（调用方需持有锁）"""
+        if time.monotonic() - self.last_save >= MANIFEST_SAVE_INTERVAL:
+            self.write_changes()
+        elif self._timer is None:
+            self._timer = threading.Timer(MANIFEST_SAVE_INTERVAL, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """立即写回尚未保存的修改"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self.dirty:
+                self.write_changes()
+
+    @classmethod
+    def flush_all(cls):
+        """写回所有清单、失败日志和图片队列中尚未保存的修改，在一次运行结束时调用"""
+        with cls._instances_lock:
+            instances = list(cls._instances.values())
+        for instance in instances:
+            instance.flush()
+
+    def write_changes(self):
+        """重新读取磁盘上的内容（兼容多进程同时写入），只合并本进程修改过的条目后写回（调用方需持有锁）"""
+        posts = self.load()
+        for key, entry in self.dirty.items():
+            if entry is None:
+                posts.pop(key, None)
+            else:
+                posts[key] = entry
+        self.posts = posts
+        self.dirty = {}
+        self.save()
+        self.last_save = time.monotonic()
+
+    def save(self):
+        """原子写回磁盘（调用方需持有锁）"""
+        tmp_path = self.path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'posts': self.posts}, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+
+atexit.register(PostManifest.flush_all)
+
+
+class FailedJournal(PostManifest):
+    """永久失败图片的日志：按源文件记录失败的 URL 及原因，供“仅重试失败图片”使用"""
+
+    FILE_NAME = ".yuque-to-hexo-failed.json"
+
+
+class ImageQueue(PostManifest):
+    """先写出文字、图片稍后下载的文章队列：按加入顺序记录每篇文章待下载的图片（按文中出现顺序），
+    中断后下次运行继续处理"""
+
+    FILE_NAME = ".yuque-to-hexo-queue.json"
+
+
+def split_terms(value):
+    """拆分 Front Matter 中的一项：支持 [a, b] 行内列表和单个值"""
+    value = value.strip()
+    if value.startswith('[') and value.endswith(']'):
+        items = value[1:-1].split(',')
+    else:
+        items = [value]
+    return [item.strip().strip('\'"') for item in items if item.strip().strip('\'"')]
+
+
+def parse_front_matter_terms(path):
+    """流式读取文章开头的 Front Matter，返回其中的分类和标签，支持 Hexo 常见的行内列表与多行列表写法"""
+    terms = {'categories': [], 'tags': []}
+    current = None
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        if f.readline().strip() != '---':
+            return terms
+        for line in f:
+            stripped = line.strip()
+            if stripped in ('---', '...'):
+                break
+            if not stripped or stripped.startswith('#'):
+                continue
+            if line[0] not in ' \t-':
+                key, _, value = stripped.partition(':')
+                current = key.strip().lower() if key.strip().lower() in terms else None
+                if current and value.strip():
+                    terms[current].extend(split_terms(value))
+            elif current and stripped.startswith('-'):
+                # 多行列表；层级分类可写作 "- [父分类, 子分类]"
+                terms[current].extend(split_terms(stripped[1:]))
+    return {key: list(dict.fromkeys(values)) for key, values in terms.items()}
+
+
+class TaxonomyIndex:
+    """由 source/_posts 中各文章 Front Matter 汇总的分类/标签索引，按文件的修改时间和大小只重新解析变化的文章。
+    索引只是可以随时重建的缓存：每次 refresh() 有变化时整体原子写回，不需要清单的批量写回与多进程合并"""
+
+    FILE_NAME = ".yuque-to-hexo-taxonomy.json"
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.posts = self.load()
+
+    @classmethod
+    def for_posts_dir(cls, posts_dir):
+        """同一博客共用一个索引实例（保存在 source/_posts 旁边）"""
+        path = (Path(posts_dir).parent / cls.FILE_NAME).resolve()
+        with cls._instances_lock:
+            if path not in cls._instances:
+                cls._instances[path] = cls(path)
+            return cls._instances[path]
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('posts', {})
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        """原子写回磁盘（调用方需持有锁）"""
+        tmp_path = self.path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'posts': self.posts}, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+    def refresh(self):
+        """同步索引与 _posts 目录，返回 (分类使用次数, 标签使用次数)"""
+        posts_dir = self.path.parent / "_posts"
+        with self._lock:
+            seen = set()
+            changed = False
+            if posts_dir.is_dir():
+                with os.scandir(posts_dir) as entries:
+                    for entry in entries:
+                        if not entry.name.endswith('.md') or not entry.is_file():
+                            continue
+                        stat = entry.stat()
+                        seen.add(entry.name)
+                        cached = self.posts.get(entry.name)
+                        if cached and cached['mtime'] == stat.st_mtime and cached['size'] == stat.st_size:
+                            continue
+                        try:
+                            terms = parse_front_matter_terms(entry.path)
+                        except OSError:
+                            continue
+                        self.posts[entry.name] = dict(terms, mtime=stat.st_mtime, size=stat.st_size)
+                        changed = True
+            for name in set(self.posts) - seen:
+                del self.posts[name]
+                changed = True
+            if changed and self.path.parent.is_dir():
+                self.save()
+            return self.counts()
+
+    def counts(self):
+        categories, tags = Counter(), Counter()
+        for entry in self.posts.values():
+            categories.update(entry['categories'])
+            tags.update(entry['tags'])
+        return categories, tags
+
+
+def read_hexo_config(root):
+    """读取博客 _config.yml 中的顶层标量和一层嵌套（如 search.path），不依赖 YAML 库"""
+    config = {}
+    section = None
+    try:
+        with open(Path(root) / "_config.yml", 'r', encoding='utf-8') as f:
+            for line in f:
+                stripped = line.split(' #')[0].rstrip()
+                if not stripped.strip() or stripped.lstrip().startswith(('#', '-')):
+                    continue
+                match = re.match(r'^(\s*)([\w-]+):\s*(.*)$', stripped)
+                if not match:
+                    continue
+                indent, key, value = match.groups()
+                value = value.strip().strip('\'"')
+                if not indent:
+                    section = None if value else config.setdefault(key, {})
+                    if value:
+                        config[key] = value
+                elif isinstance(section, dict):
+                    section[key] = value
+    except OSError:
+        pass
+    return config
+
+
+class SearchIndex:
+    """hexo-generator-search 生成的本地搜索索引（public 下的 search.xml / search.json）。
+    每篇文章转换后的条目先保存在内存中，一批转换结束时由 flush_all() 按 URL 一次性更新或插入，
+    每个索引文件只解析和写入一次，其余条目保持不变，无需重新 hexo generate。
+    正文以 Markdown 写入 content，下次完整生成时会被渲染后的 HTML 取代"""
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self._lock = threading.Lock()
+        config = read_hexo_config(self.root)
+        search = config.get('search') if isinstance(config.get('search'), dict) else {}
+        self.permalink = config.get('permalink') or ':year/:month/:day/:title/'
+        self.url_root = config.get('root') or '/'
+        self.default_category = config.get('default_category') or 'uncategorized'
+        self.with_content = search.get('content', 'true').lower() != 'false'
+        public_dir = self.root / (config.get('public_dir') or 'public')
+        # 已经生成过的索引文件都更新；都没有时按配置（默认 search.xml）创建
+        self.paths = [public_dir / name for name in ('search.xml', 'search.json') if (public_dir / name).exists()]
+        if not self.paths:
+            self.paths = [public_dir / (search.get('path') or 'search.xml')]
+        # 尚未写回的条目（URL → 条目）与需要删除的旧链接
+        self.pending = {}
+        self.removed = set()
+
+    @classmethod
+    def for_blog(cls, root):
+        path = Path(root).resolve()
+        with cls._instances_lock:
+            if path not in cls._instances:
+                cls._instances[path] = cls(path)
+            return cls._instances[path]
+
+    @classmethod
+    def flush_all(cls):
+        """写回所有博客索引中缓存的条目，在一批转换结束时调用，返回写入失败的错误信息列表"""
+        with cls._instances_lock:
+            instances = list(cls._instances.values())
+        errors = []
+        for instance in instances:
+            try:
+                instance.flush()
+            except Exception as e:
+                errors.append(str(e))
+        return errors
+
+    def post_url(self, name, front_matter):
+        """按 permalink 配置计算文章链接（与 Hexo 相同的 encodeURI 编码）"""
+        match = re.match(r'(\d{4})-(\d{1,2})-(\d{1,2})(?:[ T](\d{1,2}):(\d{1,2})(?::(\d{1,2}))?)?',
+                         str(front_matter.get('date') or ''))
+        if match:
+            year, month, day, hour, minute, second = match.groups()
+        else:
+            year, month, day = time.strftime('%Y-%m-%d').split('-')
+            hour = minute = second = None
+        categories = front_matter.get('categories') or []
+        values = {
+            'year': year, 'month': month.zfill(2), 'day': day.zfill(2),
+            'i_month': str(int(month)), 'i_day': str(int(day)),
+            'hour': (hour or '0').zfill(2), 'minute': (minute or '0').zfill(2), 'second': (second or '0').zfill(2),
+            'title': name, 'name': name, 'post_title': name,
+            'category': categories[-1] if categories else self.default_category,
+        }
+        path = re.sub(r':(i_month|i_day|post_title|year|month|day|hour|minute|second|title|name|category)',
+                      lambda m: values[m.group(1)], self.permalink)
+        return urllib.parse.quote(self.url_root.rstrip('/') + '/' + path.lstrip('/'), safe=";,/?:@&=+$-_.!~*'()#")
+
+    def upsert(self, entry, previous_url=None):
+        """缓存一篇文章的条目，flush() 时写回；previous_url 为上次写入的链接（日期或标题变化后链接会变），一并删除"""
+        if not self.with_content:
+            entry = dict(entry, content=None)
+        with self._lock:
+            if previous_url and previous_url != entry['url']:
+                self.pending.pop(previous_url, None)
+                self.removed.add(previous_url)
+            self.pending[entry['url']] = entry
+
+    def flush(self):
+        """把缓存的条目写回各索引文件；写入失败时保留缓存，下次 flush 时重试"""
+        with self._lock:
+            if not self.pending and not self.removed:
+                return
+            entries = list(self.pending.values())
+            urls = self.removed | set(self.pending)
+            for path in self.paths:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                if path.suffix == '.json':
+                    self.upsert_json(path, entries, urls)
+                else:
+                    self.upsert_xml(path, entries, urls)
+            self.pending.clear()
+            self.removed.clear()
+
+    def replace(self, path, data):
+        """原子写回（调用方需持有锁）"""
+        tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def upsert_json(self, path, new_entries, urls):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = []
+        items = [{key: entry[key] for key in ('title', 'url', 'content', 'categories', 'tags')
+                  if entry[key] is not None} for entry in new_entries]
+        entries = [e for e in entries if e.get('url') not in urls] + items
+        self.replace(path, json.dumps(entries, ensure_ascii=False).encode('utf-8'))
+
+    def upsert_xml(self, path, new_entries, urls):
+        try:
+            tree = ElementTree.parse(path)
+            search = tree.getroot()
+        except (OSError, ElementTree.ParseError):
+            search = ElementTree.Element('search')
+        for old in search.findall('entry'):
+            if (old.findtext('url') or '').strip() in urls:
+                search.remove(old)
+
+        for entry in new_entries:
+            node = ElementTree.SubElement(search, 'entry')
+            ElementTree.SubElement(node, 'title').text = entry['title']
+            ElementTree.SubElement(node, 'link', href=entry['url'])
+            ElementTree.SubElement(node, 'url').text = entry['url']
+            if entry['content'] is not None:
+                # XML 中不允许出现控制字符（与 hexo-generator-search 的 noControlChars 相同）
+                ElementTree.SubElement(node, 'content', type='html').text = re.sub(
+                    r'[\x00-\x08\x0b\x0c\x0e-\x1f]', '', entry['content'])
+            for group, tag in (('categories', 'category'), ('tags', 'tag')):
+                if entry[group]:
+                    parent = ElementTree.SubElement(node, group)
+                    for name in entry[group]:
+                        ElementTree.SubElement(parent, tag).text = name
+        self.replace(path, ElementTree.tostring(search, encoding='utf-8', xml_declaration=True))
+
+
+atexit.register(SearchIndex.flush_all)
+
+
+class ImageRefScanner:
+    """逐行扫描 Markdown 中的图片引用（![](url "title") 与 <img src>），跳过围栏代码块和行内代码"""
+
+    FENCE_RE = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+    INLINE_RE = re.compile(r'''
+        (?P<code>(?P<ticks>`+).+?(?<!`)(?P=ticks)(?!`))              # 行内代码
+        | (?P<stray>`+)                                              # 未闭合的反引号
+        | !\[(?:\\.|[^\[\]\\]|\[(?:\\.|[^\[\]\\])*\])*\]\(\s*        # alt 中允许一层嵌套的 [...]
+          (?:<(?P<angle_url>[^<>\n]*)>
+          |(?P<md_url>(?:\\.|[^\s()<>\\]|\((?:\\.|[^\s()<>\\])*\))+))  # 链接中允许成对的 (...)
+          (?:\s+(?:"[^"]*"|'[^']*'|\([^()]*\)))?\s*\)                 # ![alt](url "title")
+        | (?i:<img\b[^>]*?\bsrc\s*=\s*
+          (?:"(?P<dq_url>[^"]*)"|'(?P<sq_url>[^']*)'|(?P<bare_url>[^\s"'>]+))[^>]*>)  # <img src="url">
+    ''', re.VERBOSE)
+    URL_GROUPS = ('angle_url', 'md_url', 'dq_url', 'sq_url', 'bare_url')
+
+    def __init__(self):
+        self.fence = None
+
+    def scan_line(self, line):
+        """返回该行中图片 URL 的 (起始, 结束, url) 列表，并维护围栏代码块状态"""
+        fence_match = self.FENCE_RE.match(line)
+        if self.fence:
+            if fence_match:
+                marker = fence_match.group(1)
+                if marker[0] == self.fence[0] and len(marker) >= len(self.fence) \
+                        and not line[fence_match.end():].strip():
+                    self.fence = None
+            return []
+        if fence_match:
+            marker = fence_match.group(1)
+            if not (marker[0] == '`' and '`' in line[fence_match.end():]):
+                self.fence = marker
+                return []
+        if '!' not in line and '<' not in line:
+            return []
+
+        refs = []
+        for match in self.INLINE_RE.finditer(line):
+            for group in self.URL_GROUPS:
+                url = match.group(group)
+                if url:
+                    refs.append((match.start(group), match.end(group), url))
+                    break
+        return refs
+
+    def scan(self, content):
+        """扫描整篇文档，返回按位置排序的 (起始, 结束, url) 列表"""
+        refs = []
+        offset = 0
+        for line in content.splitlines(keepends=True):
+            refs.extend((offset + start, offset + end, url) for start, end, url in self.scan_line(line))
+            offset += len(line)
+        return refs
+
+    @staticmethod
+    def rewrite(content, refs, url_map):
+        """根据 URL→本地路径映射一次性重建文档"""
+        pieces = []
+        last = 0
+        for start, end, url in refs:
+            local_path = url_map.get(url)
+            if local_path is None:
+                continue
+            pieces.append(content[last:start])
+            pieces.append(local_path)
+            last = end
+        pieces.append(content[last:])
+        return ''.join(pieces)
+
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def optimize_image(src_path, dst_path, max_width, quality, fmt):
+    """在子进程中压缩单张图片并写入 dst_path，返回新文件大小；动图等无需处理的图片返回 None"""
+    from PIL import Image
+
+    with Image.open(src_path) as img:
+        if getattr(img, 'is_animated', False):
+            return None
+        target_format = (fmt or img.format or 'PNG').upper()
+        if max_width and img.width > max_width:
+            img = img.resize((max_width, max(1, round(img.height * max_width / img.width))), Image.LANCZOS)
+        if target_format == 'JPEG':
+            if img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            img.save(dst_path, format='JPEG', quality=quality, optimize=True, progressive=True)
+        elif target_format == 'WEBP':
+            img.save(dst_path, format='WEBP', quality=quality, method=6)
+        else:
+            img.save(dst_path, format=target_format, optimize=True)
+    return os.path.getsize(dst_path)
+
+
+def create_optimize_pool(optimize_options):
+    """一次运行共用的图片压缩进程池（未开启压缩时返回 None），由调用方在运行结束时 shutdown()。
+    每篇文章各自创建进程池时，大批量转换会反复启动子进程，在 Windows（spawn）上尤其慢"""
+    if not optimize_options:
+        return None
+    options = dict(DEFAULT_OPTIMIZE_OPTIONS, **optimize_options)
+    return ProcessPoolExecutor(max_workers=max(1, options['workers']))
+
+
+# Linux 上的 FICLONE ioctl，用于在 Btrfs/XFS 等文件系统上创建 reflink
+FICLONE = 0x40049409
+
+
+def reflink(src_path, dst_path):
+    """创建写时复制的副本（reflink），不支持时抛出 OSError"""
+    try:
+        import fcntl
+    except ImportError:  # Windows
+        raise OSError("reflink 不可用")
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(dst_path)
+            raise
+
+
+class AssetStore:
+    """按内容哈希只保存一份的共享图片库（source/.yuque-to-hexo-assets），
+    各文章的图片文件夹通过硬链接或 reflink 引用，都不支持时复制"""
+
+    DIR_NAME = ".yuque-to-hexo-assets"
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_posts_dir(cls, posts_dir):
+        """同一博客共用一个实例，图片库保存在 source/_posts 旁边（Hexo 不会发布点开头的目录）"""
+        path = (Path(posts_dir).parent / cls.DIR_NAME).resolve()
+        with cls._instances_lock:
+            if path not in cls._instances:
+                cls._instances[path] = cls(path)
+            return cls._instances[path]
+
+    def object_path(self, digest, ext):
+        return self.directory / f"{digest}{ext.lower()}"
+
+    def add(self, src_path, digest, ext):
+        """把文件移入图片库（已有相同内容时删除源文件），返回库中的路径"""
+        obj_path = self.object_path(digest, ext)
+        with self._lock:
+            if obj_path.exists():
+                os.remove(src_path)
+            else:
+                os.replace(src_path, obj_path)
+        return obj_path
+
+    def link(self, obj_path, target):
+        """在文章图片文件夹中引用库中的文件，返回使用的方式"""
+        try:
+            os.link(obj_path, target)
+            return 'hardlink'
+        except OSError:
+            pass
+        try:
+            reflink(obj_path, target)
+            return 'reflink'
+        except OSError:
+            shutil.copyfile(obj_path, target)
+            return 'copy'
+
+    def gc(self, posts_dir):
+        """删除不再被任何文章图片文件夹引用的库文件，返回 (删除数量, 释放字节数)。
+        仍有硬链接的文件直接保留；复制或 reflink 的引用按大小和内容哈希比对"""
+        referenced_sizes = {}
+        posts_dir = Path(posts_dir)
+        if posts_dir.is_dir():
+            with os.scandir(posts_dir) as folders:
+                for folder in folders:
+                    if not folder.is_dir() or folder.name.startswith('.'):
+                        continue
+                    with os.scandir(folder.path) as entries:
+                        for entry in entries:
+                            if entry.is_file() and not entry.name.startswith('.'):
+                                referenced_sizes.setdefault(entry.stat().st_size, []).append(entry.path)
+
+        removed = freed = 0
+        referenced_digests = set()
+        hashed_sizes = set()
+        with self._lock:
+            for entry in list(os.scandir(self.directory)):
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                if entry.name.endswith('.tmp'):
+                    os.remove(entry.path)
+                    continue
+                if stat.st_nlink > 1:
+                    continue
+                # 只对大小相同的文章图片计算哈希
+                if stat.st_size in referenced_sizes and stat.st_size not in hashed_sizes:
+                    hashed_sizes.add(stat.st_size)
+                    for path in referenced_sizes[stat.st_size]:
+                        try:
+                            referenced_digests.add(file_sha256(path))
+                        except OSError:
+                            continue
+                if os.path.splitext(entry.name)[0] in referenced_digests:
+                    continue
+                os.remove(entry.path)
+                removed += 1
+                freed += stat.st_size
+        return removed, freed
+
+
+class FolderIndex:
+    """图片文件夹的内存索引：目录只扫描一次，在锁内原子分配不重名的文件名，内容相同的文件直接复用。
+    指定共享图片库时，新文件保存到库中，文件夹里只放链接"""
+
+    def __init__(self, directory, store=None, references=()):
+        self.directory = Path(directory)
+        self.store = store
+        self.link_modes = Counter()
+        self._lock = threading.Lock()
+        # 每个文件被多少个图片 URL 引用（内容相同的图片会映射到同一个文件）
+        self.refs = Counter(references)
+        self.names = set()
+        self.sizes = {}
+        self.digests = {}
+        self.counters = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                self.names.add(os.path.normcase(entry.name))
+                if entry.is_file() and not entry.name.startswith('.'):
+                    self.sizes.setdefault(entry.stat().st_size, []).append(entry.name)
+
+    def reserve(self, filename):
+        with self._lock:
+            return self.reserve_name(filename)
+
+    def reserve_name(self, filename):
+        """分配不冲突的文件名（image.png、image_1.png ...），调用方需持有锁"""
+        name, ext = os.path.splitext(filename)
+        candidate = filename
+        counter = self.counters.get(filename, 1)
+        while os.path.normcase(candidate) in self.names:
+            candidate = f"{name}_{counter}{ext}"
+            counter += 1
+        self.counters[filename] = counter
+        self.names.add(os.path.normcase(candidate))
+        return self.directory / candidate
+
+    def find_duplicate(self, digest, size):
+        """查找内容相同的已有文件，只对大小相同的文件计算哈希（结果会缓存），调用方需持有锁"""
+        for name in self.sizes.get(size, []):
+            if name not in self.digests:
+                try:
+                    self.digests[name] = file_sha256(self.directory / name)
+                except OSError:
+                    continue
+            if self.digests[name] == digest and (self.directory / name).exists():
+                return self.directory / name
+        return None
+
+    def replace(self, src_path, target, digest=None):
+        """用下载好的新版本原子替换目录中已有的文件，返回新版本的路径。
+        该文件还被其他 URL 引用（内容相同的图片复用同一个文件）时不能改写，新版本另存为新文件名，只有本 URL 改用新文件。
+        使用共享图片库时，文件夹中的文件与其他文章共用同一个库文件，新版本作为新对象入库后替换链接，不能原地改写"""
+        digest = digest or file_sha256(src_path)
+        size = os.path.getsize(src_path)
+        with self._lock:
+            if self.refs[target.name] > 1:
+                self.refs[target.name] -= 1
+                return self.install(src_path, self.reserve_name(target.name), digest, size)
+            if self.store is not None:
+                obj_path = self.store.add(src_path, digest, target.suffix)
+                tmp_path = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+                tmp_path.unlink(missing_ok=True)
+                self.link_modes[self.store.link(obj_path, tmp_path)] += 1
+                os.replace(tmp_path, target)
+            else:
+                os.replace(src_path, target)
+            for names in self.sizes.values():
+                if target.name in names:
+                    names.remove(target.name)
+            self.sizes.setdefault(size, []).append(target.name)
+            self.digests[target.name] = digest
+            return target
+
+    def place(self, src_path, filename, digest=None):
+        """把下载好的文件移入目录：已有相同内容的文件则复用并删除源文件，否则分配新文件名"""
+        digest = digest or file_sha256(src_path)
+        size = os.path.getsize(src_path)
+        with self._lock:
+            existing = self.find_duplicate(digest, size)
+            if existing is not None:
+                os.remove(src_path)
+                self.refs[existing.name] += 1
+                return existing
+            return self.install(src_path, self.reserve_name(filename), digest, size)
+
+    def install(self, src_path, target, digest, size):
+        """把文件放到已分配的文件名上（共享图片库时入库后放链接），调用方需持有锁"""
+        if self.store is not None:
+            obj_path = self.store.add(src_path, digest, target.suffix)
+            self.link_modes[self.store.link(obj_path, target)] += 1
+        else:
+            os.replace(src_path, target)
+        self.sizes.setdefault(size, []).append(target.name)
+        self.digests[target.name] = digest
+        self.refs[target.name] += 1
+        return target
+
+
+class ImageCache:
+    """跨文章、跨运行的图片磁盘缓存，按规范化 URL 和内容 SHA-256 索引，超出容量时按 LRU 淘汰"""
+
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.objects_dir = self.cache_dir / "objects"
+        self.index_file = self.cache_dir / "index.json"
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.index = self.load_index()
+
+    def load_index(self):
+        index = {'urls': {}, 'objects': {}}
+        try:
+            if self.index_file.exists():
+                with open(self.index_file, 'r', encoding='utf-8') as f:
+                    index.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+        return index
+
+    def save(self):
+        """合并磁盘上其他进程写入的条目后原子写入索引文件"""
+        with self._lock:
+            on_disk = self.load_index()
+            for digest, obj in on_disk['objects'].items():
+                if digest not in self.index['objects'] and self.object_path(digest, obj['ext']).exists():
+                    self.index['objects'][digest] = obj
+            for url, entry in on_disk['urls'].items():
+                if entry['sha256'] in self.index['objects']:
+                    self.index['urls'].setdefault(url, entry)
+            self.evict()
+            tmp_file = self.index_file.with_suffix(f'.{os.getpid()}.tmp')
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.index, f)
+            os.replace(tmp_file, self.index_file)
+
+    def normalize_url(self, url):
+        """去掉 URL 片段（语雀常带 #averageHue 等参数），作为缓存键"""
+        return urllib.parse.urldefrag(url)[0]
+
+    def object_path(self, digest, ext):
+        return self.objects_dir / f"{digest}{ext}"
+
+    def lookup(self, url):
+        """命中则返回 (缓存文件路径, 扩展名)，否则返回 None"""
+        with self._lock:
+            entry = self.index['urls'].get(self.normalize_url(url))
+            if not entry:
+                return None
+            digest = entry['sha256']
+            obj = self.index['objects'].get(digest)
+            path = self.object_path(digest, entry['ext'])
+            if obj is None or not path.exists():
+                self.index['urls'].pop(self.normalize_url(url), None)
+                self.index['objects'].pop(digest, None)
+                return None
+            obj['last_used'] = time.time()
+            return path, entry['ext']
+
+    def store(self, url, file_path, digest=None):
+        """将已下载的文件放入缓存，内容相同的文件只保存一份"""
+        file_path = Path(file_path)
+        digest = digest or file_sha256(file_path)
+        ext = file_path.suffix
+        path = self.object_path(digest, ext)
+        with self._lock:
+            if not path.exists():
+                tmp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+                shutil.copyfile(file_path, tmp_path)
+                os.replace(tmp_path, path)
+            self.index['objects'][digest] = {'size': path.stat().st_size, 'ext': ext, 'last_used': time.time()}
+            self.index['urls'][self.normalize_url(url)] = {'sha256': digest, 'ext': ext}
+            self.evict()
+
+    def evict(self):
+        """超出容量上限时删除最久未使用的对象（调用方需持有锁）"""
+        objects = self.index['objects']
+        total = sum(obj['size'] for obj in objects.values())
+        if total <= self.max_bytes:
+            return
+        for digest, obj in sorted(objects.items(), key=lambda item: item[1]['last_used']):
+            if total <= self.max_bytes:
+                break
+            self.object_path(digest, obj['ext']).unlink(missing_ok=True)
+            del objects[digest]
+            total -= obj['size']
+        self.index['urls'] = {url: entry for url, entry in self.index['urls'].items()
+                              if entry['sha256'] in objects}
+
+
+class YuqueArchive:
+    """语雀导出的知识库压缩包：只读取一次目录，文章和图片按成员流式读取，不解压到磁盘"""
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = Path(path).resolve()
+        stat = self.path.stat()
+        self.stamp = (stat.st_mtime, stat.st_size)
+        self.zip = zipfile.ZipFile(self.path)
+        # 正在读取的转换数；retired 后不再分配给新的转换，最后一个读取结束时关闭文件
+        self.users = 0
+        self.retired = False
+        self._lock = threading.Lock()
+        self.members = {}
+        for info in self.zip.infolist():
+            if not info.is_dir():
+                self.members[self.decode_name(info)] = info
+        self.posts = sorted(name for name in self.members if name.lower().endswith('.md'))
+
+        # 不同目录下的同名文档输出为不同的文章
+        self.output_stems = {}
+        used = set()
+        for name in self.posts:
+            stem = candidate = PurePosixPath(name).stem
+            suffix = 1
+            while candidate.lower() in used:
+                candidate = f"{stem}-{suffix}"
+                suffix += 1
+            used.add(candidate.lower())
+            self.output_stems[name] = candidate
+
+    @classmethod
+    def for_path(cls, path):
+        """同一进程中共用一个实例，多篇文章并行转换时不重复读取压缩包目录；
+        压缩包被替换后重新读取，旧实例在没有转换读取时关闭"""
+        path = Path(path).resolve()
+        stat = path.stat()
+        with cls._instances_lock:
+            archive = cls._instances.get(path)
+            if archive is None or archive.stamp != (stat.st_mtime, stat.st_size):
+                if archive is not None:
+                    archive.retire()
+                archive = cls._instances[path] = cls(path)
+            return archive
+
+    @classmethod
+    def release_all(cls):
+        """关闭所有压缩包（正在读取的在读取结束后关闭），之后的 for_path 会重新读取。
+        在一批转换结束或监视空闲时调用：Windows 上仍被打开的压缩包无法被导出工具替换或删除"""
+        with cls._instances_lock:
+            archives = list(cls._instances.values())
+            cls._instances.clear()
+        for archive in archives:
+            archive.retire()
+
+    def acquire(self):
+        """转换开始读取前调用，实例已关闭（压缩包已更新或已释放）时返回 False"""
+        with self._lock:
+            if self.retired:
+                return False
+            self.users += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.users -= 1
+            if self.retired and not self.users:
+                self.zip.close()
+
+    def retire(self):
+        """不再分配给新的转换，没有转换在读取时立即关闭"""
+        with self._lock:
+            self.retired = True
+            if not self.users:
+                self.zip.close()
+
+    @staticmethod
+    def decode_name(info):
+        """未设置 UTF-8 标志的成员名按 cp437 解码过，尝试还原为 UTF-8 / GBK 中文名"""
+        name = info.filename
+        if info.flag_bits & 0x800:
+            return name
+        raw = name.encode('cp437', errors='replace')
+        for encoding in ('utf-8', 'gbk'):
+            try:
+                return raw.decode(encoding)
+            except UnicodeDecodeError:
+                continue
+        return name
+
+    def virtual_path(self, member):
+        """文章在清单和失败日志中的标识：压缩包路径!/成员名"""
+        return f"{self.path}!/{member}"
+
+    def categories(self, member):
+        """知识库中的目录结构作为层级分类"""
+        return list(PurePosixPath(member).parent.parts)
+
+    def open_text(self, member):
+        return io.TextIOWrapper(self.zip.open(self.members[member]), encoding='utf-8')
+
+    def open_binary(self, member):
+        return self.zip.open(self.members[member])
+
+    def mtime(self, member):
+        return time.mktime(self.members[member].date_time + (0, 0, -1))
+
+    def file_size(self, member):
+        return self.members[member].file_size
+
+    def resolve_image(self, post_member, url):
+        """把文章中的相对图片路径解析为压缩包内的成员名，不在压缩包中时返回 None"""
+        parsed = urllib.parse.urlparse(url)
+        if parsed.scheme or parsed.netloc:
+            return None
+        path = urllib.parse.unquote(parsed.path).replace('\\', '/')
+        if path.startswith('/'):
+            candidate = path.lstrip('/')
+        else:
+            candidate = posixpath.normpath(posixpath.join(posixpath.dirname(post_member), path))
+        return candidate if candidate in self.members else None
+
+
+class DirectoryWatcher:
+    """轮询监视目录中新增或修改的 .md / .zip 文件；文件在 debounce 秒内不再变化才视为写入完成"""
+
+    def __init__(self, directories, interval=1.0, debounce=2.0, suffixes=('.md', '.zip')):
+        self.directories = [Path(d) for d in directories]
+        self.interval = interval
+        self.debounce = debounce
+        self.suffixes = suffixes
+        self.snapshot = {}
+        self.pending = {}
+        self.stopped = threading.Event()
+
+    def scan(self):
+        """返回 {路径: (修改时间, 大小)}，跳过隐藏目录和输出目录 _posts"""
+        found = {}
+        for directory in self.directories:
+            for root, dirnames, filenames in os.walk(directory):
+                dirnames[:] = [name for name in dirnames if not name.startswith('.') and name != '_posts']
+                for name in filenames:
+                    if name.startswith('.') or not name.lower().endswith(self.suffixes):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    found[path] = (stat.st_mtime, stat.st_size)
+        return found
+
+    def poll(self):
+        """扫描一次，返回已经稳定的新文件或修改过的文件"""
+        now = time.monotonic()
+        ready = []
+        found = self.scan()
+        for path, signature in found.items():
+            if self.snapshot.get(path) == signature:
+                self.pending.pop(path, None)
+                continue
+            pending = self.pending.get(path)
+            if pending is None or pending[0] != signature:
+                # 仍在写入：重新开始计时
+                self.pending[path] = (signature, now)
+            elif now - pending[1] >= self.debounce:
+                del self.pending[path]
+                self.snapshot[path] = signature
+                ready.append(path)
+        for path in set(self.snapshot) - set(found):
+            del self.snapshot[path]
+        for path in set(self.pending) - set(found):
+            del self.pending[path]
+        return ready
+
+    def run(self, callback):
+        """持续轮询直到 stop()，每个就绪文件调用一次 callback"""
+        while not self.stopped.is_set():
+            for path in self.poll():
+                callback(path)
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+
+
+class PostConverter:
+    """将一篇语雀导出的 Markdown 转换为 Hexo 文章：下载图片、重写链接、添加 Front Matter"""
+
+    def __init__(self, md_path, front_matter, output_root, image_url_prefix, max_workers=8, cache=None,
+                 incremental=True, progress=None, max_retries=3, optimize_options=None, run_report=None,
+                 archive=None, shared_assets=False, search_index=False, lazy_images=False, optimize_pool=None):
+        # 来自压缩包时 md_path 为成员名，内部统一使用虚拟路径作为文章标识
+        self.archive = archive
+        self.member = md_path if archive else None
+        md_path = archive.virtual_path(md_path) if archive else md_path
+        self.md_path = md_path
+        self.front_matter = front_matter
+        self.output_root = output_root
+        self.image_url_prefix = image_url_prefix
+        self.max_workers = max_workers
+        self.session = None
+        self.cache = cache
+        self.incremental = incremental
+        self.on_progress = progress
+        self.run_report = run_report
+        self.failed_images = []
+        self.failure_reasons = {}
+        self.max_retries = max_retries
+        self.optimize_options = dict(DEFAULT_OPTIMIZE_OPTIONS, **optimize_options) if optimize_options else None
+        # 调用方传入的共用进程池；未传入时每次压缩临时创建
+        self.optimize_pool = optimize_pool
+        self.shared_assets = shared_assets
+        self.search_index = search_index
+        self.lazy_images = lazy_images
+        self.skipped = False
+        self.cancelled = threading.Event()
+        self.folder_index = None
+        self.archive_acquired = False
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_bytes_saved = 0
+        self.hosts = set()
+        self._stats_lock = threading.Lock()
+
+    def cancel(self):
+        """请求取消：尚未开始的图片不再下载，文章不会写出"""
+        self.cancelled.set()
+
+    def acquire_archive(self):
+        """开始读取压缩包前占用它；排队期间压缩包被重新导出或已释放时改用最新的实例"""
+        if self.archive is None:
+            return
+        while not self.archive.acquire():
+            self.archive = YuqueArchive.for_path(self.archive.path)
+        self.archive_acquired = True
+
+    def release_archive(self):
+        if self.archive_acquired:
+            self.archive_acquired = False
+            self.archive.release()
+
+    def safe_filename(self, filename):
+        filename = urllib.parse.unquote(filename)
+        filename = os.path.basename(filename).split('?')[0]
+        return re.sub(r'[\\/*?:"<>|]', '_', filename)
+
+    def is_valid_url(self, url):
+        """检查 URL 是否有效（包含协议头）"""
+        return url.startswith(('http://', 'https://'))
+
+    def create_session(self):
+        """创建本次转换共享的连接池会话，复用 TCP/TLS 连接"""
+        import requests
+        from yuque_http import TimedHTTPAdapter
+        session = requests.Session()
+        pool_size = max(1, self.max_workers)
+        adapter = TimedHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def sniff_extension(self, head):
+        """根据文件头魔数判断图片类型"""
+        if head.startswith(b'\x89PNG\r\n\x1a\n'):
+            return '.png'
+        if head.startswith(b'\xff\xd8\xff'):
+            return '.jpeg'
+        if head.startswith((b'GIF87a', b'GIF89a')):
+            return '.gif'
+        if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+            return '.webp'
+        text = head[:512].lstrip().lower()
+        if text.startswith(b'<svg') or (text.startswith(b'<?xml') and b'<svg' in text):
+            return '.svg'
+        return ''
+
+    def detect_extension(self, response, head):
+        """从 GET 响应头或首个数据块推断扩展名，无需额外的 HEAD 请求"""
+        content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        return CONTENT_TYPE_EXTENSIONS.get(content_type) or self.sniff_extension(head)
+
+    def response_validators(self, response):
+        """提取用于条件请求的 ETag / Last-Modified"""
+        return {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+
+    def write_response(self, response, save_path, metrics, offset=0):
+        """写入响应体并把字节数、传输耗时和吞吐量记入 metrics，返回响应的前 1 KB。
+        从头写入 .part 文件时先记录该响应的校验头，续传时用 If-Range 确认远端文件仍是同一版本"""
+        if not offset:
+            self.save_part_validators(save_path, self.response_validators(response))
+        transfer_start = time.perf_counter()
+        written, head = stream_to_file(response, save_path, offset)
+        elapsed = time.perf_counter() - transfer_start
+        metrics['bytes'] += written
+        metrics['transfer'] += elapsed
+        if metrics['transfer'] > 0:
+            metrics['throughput'] = metrics['bytes'] / metrics['transfer']
+        return head
+
+    def timed_get(self, download_url, headers, metrics, outcome):
+        """发起 GET 请求，把 DNS、建连与首字节耗时累加到 metrics，状态码与延迟记入 outcome 供主机限速器使用"""
+        from yuque_http import take_connection_timing
+        take_connection_timing()
+        start = time.perf_counter()
+        response = self.session.get(download_url, headers=headers, stream=True,
+                                    timeout=(CONNECT_TIMEOUT, outcome['limiter'].read_timeout()))
+        elapsed = time.perf_counter() - start
+        timing = take_connection_timing()
+        metrics['dns'] += timing['dns']
+        metrics['connect'] += timing['connect']
+        metrics['ttfb'] += max(0.0, elapsed - timing['dns'] - timing['connect'])
+        metrics['status'] = response.status_code
+        outcome.update(latency=elapsed, status=response.status_code,
+                       retry_after=parse_retry_after(response.headers.get('Retry-After')))
+        return response
+
+    def acquire_host(self, download_url):
+        """占用目标主机的一个并发名额，返回请求结果记录；取消时返回 None"""
+        limiter = HostLimiter.for_url(download_url)
+        with self._stats_lock:
+            self.hosts.add(limiter)
+        if not limiter.acquire(self.cancelled):
+            return None
+        return {'limiter': limiter}
+
+    def release_host(self, outcome, events):
+        limiter = outcome['limiter']
+        status = outcome.get('status')
+        if limiter.release(outcome.get('latency'), status, outcome.get('retry_after'), outcome.get('failed', False)):
+            events.append(('throttled', {'host': limiter.host, 'limit': limiter.limit,
+                                         'reason': "超时或连接错误" if outcome.get('failed') or not status
+                                                   else f"返回 HTTP {status}",
+                                         'retry_after': outcome.get('retry_after')}))
+
+    def revalidate_image(self, download_url, existing_path, previous, events, metrics):
+        """用 If-None-Match / If-Modified-Since 重新验证已下载的图片。有新版本时先写入 .part 文件，
+        完整读取后才替换本地文件。返回 (保存路径, 校验头, 新版本下载失败时的错误信息)"""
+        headers = {}
+        if previous.get('etag'):
+            headers['If-None-Match'] = previous['etag']
+        if previous.get('last_modified'):
+            headers['If-Modified-Since'] = previous['last_modified']
+        metrics['source'] = 'local'
+        if not headers:
+            return existing_path, previous, None
+        outcome = self.acquire_host(download_url)
+        if outcome is None:
+            return existing_path, previous, None
+        part_path = self.part_path(existing_path.parent, download_url)
+        changed = False
+        error = None
+        try:
+            with self.timed_get(download_url, headers, metrics, outcome) as response:
+                if response.status_code == 304:
+                    metrics['source'] = 'revalidated'
+                    return existing_path, previous, None
+                if response.status_code == 200:
+                    changed = True
+                    self.write_response(response, part_path, metrics)
+                    validators = self.response_validators(response)
+                else:
+                    error = f"HTTP {response.status_code}"
+        except Exception as e:
+            outcome['failed'] = True
+            error = str(e)
+        finally:
+            self.release_host(outcome, events)
+        if not changed:
+            events.append(('revalidate_failed', {'file': existing_path.name, 'error': error}))
+            return existing_path, previous, None
+
+        metrics['source'] = 'network'
+        if error is not None:
+            # 新版本传输中断：从 .part 续传，仍失败时文章继续引用本地文件，由调用方记为失败以便下次重试
+            save_path, validators, error = self.fetch_with_retry(download_url, existing_path.parent,
+                                                                 existing_path.name, events, metrics,
+                                                                 replace=existing_path)
+            if save_path is None:
+                return existing_path, previous, error
+        else:
+            self.part_validators_path(part_path).unlink(missing_ok=True)
+            save_path = self.folder_index.replace(part_path, existing_path)
+        events.append(('image_updated', {'file': save_path.name}))
+        return save_path, validators, None
+
+    def download_image(self, url, target_folder, previous=None):
+        """下载单张图片，返回 (保存路径或 None, 事件列表, 校验头)，在线程池中执行"""
+        events = []
+        download_url = url
+        if self.cancelled.is_set():
+            return None, events, {}
+        # 记录下载线程，使 trace 中每个工作线程一条时间线
+        metrics = {'url': url, 'thread': threading.get_ident(), 'source': 'network', 'status': None, 'bytes': 0,
+                   'retries': 0, 'dns': 0.0, 'connect': 0.0, 'ttfb': 0.0, 'transfer': 0.0, 'throughput': None}
+        start = time.perf_counter()
+        try:
+            bundled = self.archive.resolve_image(self.member, url) if self.archive else None
+            if bundled:
+                download_url = self.archive.virtual_path(bundled)
+            # 检查 URL 是否有效
+            elif not self.is_valid_url(url) and self.image_url_prefix:
+                # 如果 URL 无协议头，尝试补充前缀
+                download_url = urllib.parse.urljoin(self.image_url_prefix, url)
+                events.append(('prefix_added', {'url': url, 'download_url': download_url}))
+
+            if bundled:
+                # 压缩包中自带的图片直接从成员读取，不走网络；内容相同时复用已有文件
+                save_path = self.extract_bundled(bundled, target_folder)
+                validators = {}
+                metrics['source'] = 'archive'
+                metrics['bytes'] = self.archive.file_size(bundled)
+            # 上次已下载过的图片只做条件请求
+            elif previous and (target_folder / previous['file']).exists():
+                save_path, validators, error = self.revalidate_image(download_url, target_folder / previous['file'],
+                                                                     previous, events, metrics)
+                if error is not None:
+                    self.failure_reasons[url] = error
+                    events.append(('revalidate_failed', dict(metrics, file=save_path.name, download_url=download_url,
+                                                             error=error, ts=time.time(),
+                                                             duration=time.perf_counter() - start)))
+                    return save_path, events, validators
+            else:
+                parsed_url = urllib.parse.urlparse(download_url)
+                original_filename = self.safe_filename(parsed_url.path)
+
+                # 优先从本地缓存复制（先复制为 .part 再放入文件夹）
+                cached = self.cache.lookup(download_url) if self.cache else None
+                if cached:
+                    cache_path, ext = cached
+                    if not os.path.splitext(original_filename)[1]:
+                        original_filename += ext
+                    part_path = self.part_path(target_folder, download_url)
+                    shutil.copyfile(cache_path, part_path)
+                    self.part_validators_path(part_path).unlink(missing_ok=True)
+                    save_path = self.folder_index.place(part_path, original_filename, cache_path.stem)
+                    validators = {}
+                    metrics['source'] = 'cache'
+                    with self._stats_lock:
+                        self.cache_hits += 1
+                        self.cache_bytes_saved += save_path.stat().st_size
+                else:
+                    # 下载图片（写入 .part 文件，失败自动重试并断点续传）
+                    save_path, validators, error = self.fetch_with_retry(download_url, target_folder,
+                                                                         original_filename, events, metrics)
+                    if save_path is None:
+                        self.failure_reasons[url] = error
+                        events.append(('image_failed', dict(metrics, download_url=download_url, error=error,
+                                                            ts=time.time(), duration=time.perf_counter() - start)))
+                        return None, events, {}
+                    if self.cache:
+                        self.cache.store(download_url, save_path, self.folder_index.digests.get(save_path.name))
+                        with self._stats_lock:
+                            self.cache_misses += 1
+            events.append(('image_done', dict(metrics, file=save_path.name, ts=time.time(),
+                                              duration=time.perf_counter() - start)))
+            return save_path, events, validators
+        except Exception as e:
+            self.failure_reasons[url] = str(e)
+            events.append(('image_failed', dict(metrics, download_url=download_url, error=str(e),
+                                                ts=time.time(), duration=time.perf_counter() - start)))
+            return None, events, {}
+
+    def extract_bundled(self, member, target_folder):
+        """把压缩包中的图片流式复制到图片文件夹"""
+        part_path = self.part_path(target_folder, self.archive.virtual_path(member))
+        with self.archive.open_binary(member) as src, open(part_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        return self.folder_index.place(part_path, self.safe_filename(member))
+
+    def part_path(self, target_folder, download_url):
+        """未完成的下载保存为隐藏的 .part 文件，文件名由 URL 决定，便于跨运行续传"""
+        digest = hashlib.sha1(download_url.encode('utf-8')).hexdigest()[:16]
+        return target_folder / f".{digest}.part"
+
+    @staticmethod
+    def part_validators_path(part_path):
+        return part_path.with_name(part_path.name + '.json')
+
+    def save_part_validators(self, part_path, validators):
+        """记录开始写入 .part 文件的响应的 ETag / Last-Modified，都没有时删除旧记录"""
+        validators_path = self.part_validators_path(part_path)
+        validators = {key: value for key, value in validators.items() if value}
+        if not validators:
+            validators_path.unlink(missing_ok=True)
+            return
+        with open(validators_path, 'w', encoding='utf-8') as f:
+            json.dump(validators, f)
+
+    def load_part_validators(self, part_path):
+        try:
+            with open(self.part_validators_path(part_path), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def if_range_value(self, validators):
+        """If-Range 只接受强 ETag，弱 ETag 时改用 Last-Modified，都没有时返回 None"""
+        etag = validators.get('etag')
+        if etag and not etag.startswith('W/'):
+            return etag
+        return validators.get('last_modified')
+
+    def discard_part(self, part_path):
+        part_path.unlink(missing_ok=True)
+        self.part_validators_path(part_path).unlink(missing_ok=True)
+
+    def backoff_delay(self, attempt):
+        return backoff_delay(attempt)
+
+    def fetch_with_retry(self, download_url, target_folder, original_filename, events, metrics, replace=None):
+        """下载到 .part 文件，超时、连接错误、5xx/429 时退避重试并用 Range 请求续传。
+        指定 replace 时下载完成后原子替换该文件，否则放入图片文件夹。返回 (保存路径或 None, 校验头, 错误信息)"""
+        import requests
+        part_path = self.part_path(target_folder, download_url)
+        error = None
+        retry_after = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                # 服务器给出 Retry-After 时至少等待这么久
+                delay = max(self.backoff_delay(attempt), retry_after or 0)
+                metrics['retries'] = attempt
+                events.append(('retry', {'download_url': download_url, 'attempt': attempt, 'delay': delay,
+                                         'error': error}))
+                if self.cancelled.wait(delay):
+                    return None, {}, "已取消"
+            offset = part_path.stat().st_size if part_path.exists() else 0
+            headers = {}
+            part_validators = self.load_part_validators(part_path) if offset else {}
+            if offset:
+                if_range = self.if_range_value(part_validators)
+                if if_range is None:
+                    # 不知道残留文件属于哪个版本，拼接可能得到新旧混合的图片，从头下载
+                    self.discard_part(part_path)
+                    offset = 0
+                else:
+                    # 远端文件已变化时服务器返回 200 和完整的新版本，从头写入
+                    headers = {'Range': f'bytes={offset}-', 'If-Range': if_range}
+            outcome = self.acquire_host(download_url)
+            if outcome is None:
+                return None, {}, "已取消"
+            try:
+                with self.timed_get(download_url, headers, metrics, outcome) as response:
+                    if response.status_code in RETRY_STATUS_CODES:
+                        error = f"HTTP {response.status_code}"
+                        continue
+                    if response.status_code == 416:
+                        # 续传位置无效，丢弃残留文件重新下载
+                        self.discard_part(part_path)
+                        error = "HTTP 416"
+                        continue
+                    if response.status_code not in (200, 206):
+                        return None, {}, f"HTTP {response.status_code}"
+
+                    resumed = response.status_code == 206 and offset > 0
+                    if resumed:
+                        events.append(('resume', {'download_url': download_url, 'offset': offset}))
+                    head = self.write_response(response, part_path, metrics, offset if resumed else 0)
+                    if resumed:
+                        with open(part_path, 'rb') as f:
+                            head = f.read(1024)
+
+                    # 补充扩展名（根据响应头或文件头魔数）
+                    if not os.path.splitext(original_filename)[1]:
+                        original_filename += self.detect_extension(response, head)
+                    validators = self.response_validators(response)
+                    if resumed and not any(validators.values()):
+                        validators = dict(validators, **part_validators)
+            except (requests.ConnectionError, requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError) as e:
+                outcome['failed'] = True
+                error = str(e)
+                continue
+            finally:
+                retry_after = outcome.get('retry_after')
+                self.release_host(outcome, events)
+
+            self.part_validators_path(part_path).unlink(missing_ok=True)
+            if replace is not None:
+                return self.folder_index.replace(part_path, replace), validators, None
+            return self.folder_index.place(part_path, original_filename), validators, None
+        return None, {}, error
+
+    def emit(self, event_type, percent=None, **fields):
+        """记录一条以文章文件名为 post 的结构化事件"""
+        emit_event(self.run_report, self.on_progress, Path(self.md_path).name, event_type, percent, **fields)
+
+    @contextmanager
+    def stage(self, name):
+        """记录一个处理阶段的耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.emit('stage', name=name, duration=time.perf_counter() - start)
+
+    def open_source(self):
+        """打开源文件（或压缩包中的成员）用于逐行读取"""
+        if self.archive:
+            return self.archive.open_text(self.member)
+        return open(self.md_path, 'r', encoding='utf-8')
+
+    def source_mtime(self):
+        if self.archive:
+            return self.archive.mtime(self.member)
+        return Path(self.md_path).stat().st_mtime
+
+    def scan_source(self):
+        """逐行读取源文件，返回 (内容哈希, 去重后的图片 URL 列表)"""
+        sha256 = hashlib.sha256()
+        scanner = ImageRefScanner()
+        image_urls = {}
+        with self.open_source() as f:
+            for line in f:
+                sha256.update(line.encode('utf-8'))
+                for _, _, url in scanner.scan_line(line):
+                    image_urls.setdefault(url, None)
+        return sha256.hexdigest(), list(image_urls)
+
+    def build_front_matter(self):
+        front_matter = '---\n'
+        for key, value in self.front_matter.items():
+            if isinstance(value, list):
+                value = f"[{', '.join(value)}]"
+            front_matter += f"{key}: {value}\n"
+        front_matter += '---\n\n'
+        return front_matter
+
+    def write_post(self, output_path, url_map, source_path=None, header=None):
+        """逐行重写图片链接并写入临时文件，完成后原子替换为目标文章，内存占用与文档大小无关"""
+        scanner = ImageRefScanner()
+        header = self.build_front_matter() if header is None else header
+        fd, tmp_name = tempfile.mkstemp(prefix=f".{output_path.stem}.", suffix='.tmp', dir=output_path.parent)
+        try:
+            src = open(source_path, 'r', encoding='utf-8') if source_path else self.open_source()
+            with open(fd, 'w', encoding='utf-8') as out, src:
+                out.write(header)
+                for line in src:
+                    refs = scanner.scan_line(line)
+                    out.write(ImageRefScanner.rewrite(line, refs, url_map) if refs else line)
+            os.replace(tmp_name, output_path)
+        except BaseException:
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+            raise
+
+    def posts_dir(self):
+        """确定输出根目录（博客根目录/source/_posts），未指定时使用 md 文件或压缩包所在目录"""
+        if self.output_root:
+            output_root = Path(self.output_root)
+        else:
+            output_root = self.archive.path.parent if self.archive else Path(self.md_path).parent
+        posts_dir = output_root / "source" / "_posts"
+        posts_dir.mkdir(parents=True, exist_ok=True)
+        return posts_dir
+
+    def resolve_paths(self, folder_name=None):
+        """返回 (source/_posts 目录, 图片文件夹, 输出文章路径)"""
+        if folder_name is None:
+            folder_name = self.archive.output_stems[self.member] if self.archive else Path(self.md_path).stem
+        posts_dir = self.posts_dir()
+
+        # 创建目标文件夹（在source/_posts/example）
+        target_folder = posts_dir / folder_name
+        target_folder.mkdir(exist_ok=True)
+        return posts_dir, target_folder, posts_dir / f"{folder_name}.md"
+
+    def download_all(self, image_urls, target_folder, previous_images):
+        """并行下载图片，返回 (URL→相对路径映射, 图片清单条目)，失败的 URL 记入 failed_images"""
+        total_images = len(image_urls)
+        url_map = {}
+        image_entries = {}
+        finished_count = 0
+
+        store = AssetStore.for_posts_dir(target_folder.parent) if self.shared_assets else None
+        self.folder_index = FolderIndex(target_folder, store, [entry['file'] for entry in previous_images.values()])
+        self.session = self.create_session()
+        with self.session, ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as executor:
+            futures = {executor.submit(self.download_image, url, target_folder, previous_images.get(url)): url
+                       for url in image_urls}
+            for future in as_completed(futures):
+                url = futures[future]
+                save_path, events, validators = future.result()
+                finished_count += 1
+                percent = int(finished_count / total_images * 100)
+                for event_type, fields in events:
+                    self.emit(event_type, percent, **fields)
+                if save_path is None:
+                    self.failed_images.append(url)
+                    continue
+                if url in self.failure_reasons:
+                    # 新版本下载失败：文章仍引用本地文件，同时记为失败，下次转换或重试时再下载
+                    self.failed_images.append(url)
+                # 使用相对路径替换图片链接，如 example/image.jpg
+                url_map[url] = f"{target_folder.name}/{save_path.name}"
+                image_entries[url] = dict(validators, file=save_path.name)
+        return url_map, image_entries
+
+    def finish_downloads(self):
+        """输出失败警告与缓存统计"""
+        if self.failed_images:
+            self.emit('images_failed', 0, count=len(self.failed_images))
+
+        if self.cache:
+            self.cache.save()
+            self.emit('cache_stats', 100, hits=self.cache_hits, misses=self.cache_misses,
+                      bytes_saved=self.cache_bytes_saved)
+
+        link_modes = self.folder_index.link_modes if self.folder_index else None
+        if link_modes:
+            self.emit('assets_linked', 100, hardlink=link_modes['hardlink'], reflink=link_modes['reflink'],
+                      copy=link_modes['copy'])
+
+        # 各主机当前的并发上限与延迟
+        for limiter in sorted(self.hosts, key=lambda limiter: limiter.host):
+            self.emit('host_limits', 100, **limiter.stats())
+
+    def record_failures(self, posts_dir, output_path):
+        """将永久失败的图片写入失败日志，全部成功时移除该文章的记录"""
+        journal = FailedJournal.for_posts_dir(posts_dir)
+        if self.failed_images:
+            journal.update(self.md_path, {
+                'output': output_path.name,
+                'urls': {url: self.failure_reasons.get(url, '') for url in self.failed_images},
+            })
+        else:
+            journal.remove(self.md_path)
+
+    def optimize_images(self, target_folder, url_map, image_entries):
+        """在进程池中压缩/转换已下载的图片，按内容哈希 sidecar 跳过已优化的文件，返回更新后的映射"""
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            self.emit('optimize_unavailable', 100)
+            return url_map, image_entries
+
+        options = self.optimize_options
+        fmt = options['format']
+        options_key = f"{options['max_width']}:{options['quality']}:{fmt or ''}"
+        sidecar_path = target_folder / OPTIMIZE_SIDECAR
+        try:
+            with open(sidecar_path, 'r', encoding='utf-8') as f:
+                optimized = json.load(f)
+        except (OSError, ValueError):
+            optimized = {}
+
+        pending = {}
+        for entry in image_entries.values():
+            name = entry['file']
+            path = target_folder / name
+            if name in pending or path.suffix.lower() not in OPTIMIZABLE_EXTENSIONS:
+                continue
+            if optimized.get(name) == {'sha256': file_sha256(path), 'options': options_key}:
+                continue
+            pending[name] = target_folder / f".{name}.opt"
+
+        renamed = {}
+        bytes_before = bytes_after = 0
+        pool = nullcontext(self.optimize_pool) if self.optimize_pool else create_optimize_pool(options)
+        with pool as executor:
+            futures = {executor.submit(optimize_image, str(target_folder / name), str(tmp_path),
+                                       options['max_width'], options['quality'], fmt): name
+                       for name, tmp_path in pending.items()}
+            for future in as_completed(futures):
+                name = futures[future]
+                src_path, tmp_path = target_folder / name, pending[name]
+                try:
+                    new_size = future.result()
+                except Exception as e:
+                    new_size = None
+                    self.emit('optimize_failed', 100, file=name, error=str(e))
+                old_size = src_path.stat().st_size
+                if new_size is None or new_size >= old_size:
+                    # 没有变小则保留原文件
+                    tmp_path.unlink(missing_ok=True)
+                    optimized[name] = {'sha256': file_sha256(src_path), 'options': options_key}
+                    continue
+                new_path = src_path
+                if fmt and src_path.suffix.lower() != f".{fmt.lower()}":
+                    new_path = self.folder_index.reserve(f"{src_path.stem}.{fmt.lower()}")
+                os.replace(tmp_path, new_path)
+                if new_path != src_path:
+                    src_path.unlink()
+                    renamed[name] = new_path.name
+                optimized[new_path.name] = {'sha256': file_sha256(new_path), 'options': options_key}
+                bytes_before += old_size
+                bytes_after += new_size
+
+        tmp_sidecar = sidecar_path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp_sidecar, 'w', encoding='utf-8') as f:
+            json.dump(optimized, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_sidecar, sidecar_path)
+
+        if renamed:
+            for url, entry in image_entries.items():
+                if entry['file'] in renamed:
+                    entry['file'] = renamed[entry['file']]
+                    url_map[url] = f"{target_folder.name}/{entry['file']}"
+        if bytes_before:
+            self.emit('optimize_done', 100, count=len(pending), bytes_before=bytes_before, bytes_after=bytes_after)
+        return url_map, image_entries
+
+    def convert(self):
+        """执行转换，成功返回 True"""
+        try:
+            self.acquire_archive()
+            posts_dir, target_folder, output_path = self.resolve_paths()
+
+            # 增量转换：源文件与 Front Matter 均未变化且输出完整时直接跳过
+            manifest = PostManifest.for_posts_dir(posts_dir)
+            previous = manifest.get(self.md_path) if self.incremental else None
+            previous = previous or {}
+            previous_images = previous.get('images', {})
+            front_matter_hash = PostManifest.hash_text(json.dumps(self.front_matter, sort_keys=True, ensure_ascii=False))
+            source_mtime = self.source_mtime()
+            outputs_intact = output_path.exists() and all(
+                (target_folder / image['file']).exists() for image in previous_images.values())
+            if previous and previous.get('front_matter') == front_matter_hash and previous.get('mtime') == source_mtime \
+                    and not previous.get('failed') and not previous.get('pending') and outputs_intact:
+                self.emit('skipped', 100, reason='mtime')
+                self.skipped = True
+                return True
+
+            # 流式读取原始内容：边计算哈希边收集图片 URL，不把整篇文档载入内存
+            with self.stage('scan'):
+                source_hash, image_urls = self.scan_source()
+            if previous and previous.get('sha256') == source_hash \
+                    and previous.get('front_matter') == front_matter_hash \
+                    and not previous.get('failed') and not previous.get('pending') and outputs_intact:
+                manifest.update(self.md_path, dict(previous, mtime=source_mtime))
+                self.emit('skipped', 100, reason='content')
+                self.skipped = True
+                return True
+
+            if self.lazy_images and image_urls:
+                return self.publish_text(manifest, posts_dir, output_path, image_urls, {
+                    'sha256': source_hash,
+                    'mtime': source_mtime,
+                    'front_matter': front_matter_hash,
+                    'output': output_path.name,
+                    # 只保留本文仍在使用的图片，下载完成后与新下载的合并
+                    'images': {url: previous_images[url] for url in image_urls if url in previous_images},
+                    'failed': [],
+                })
+
+            # 并行下载图片
+            with self.stage('download'):
+                url_map, image_entries = self.download_all(image_urls, target_folder, previous_images)
+
+            if self.cancelled.is_set():
+                self.emit('cancelled', 0)
+                return False
+
+            self.finish_downloads()
+
+            # 可选：多进程压缩图片，格式变化时同步更新链接
+            if self.optimize_options:
+                with self.stage('optimize'):
+                    url_map, image_entries = self.optimize_images(target_folder, url_map, image_entries)
+
+            # 写入 Front Matter 与重写后的正文（到source/_posts）
+            header = self.build_front_matter()
+            with self.stage('write'):
+                self.write_post(output_path, url_map, header=header)
+
+            search_url = (manifest.get(self.md_path) or {}).get('search_url')
+            if self.search_index:
+                with self.stage('search_index'):
+                    search_url = self.update_search_index(posts_dir, output_path, header, search_url)
+
+            with self.stage('manifest'):
+                manifest.update(self.md_path, {
+                    'sha256': source_hash,
+                    'mtime': source_mtime,
+                    'front_matter': front_matter_hash,
+                    'output': output_path.name,
+                    'images': image_entries,
+                    'failed': self.failed_images,
+                    'search_url': search_url,
+                })
+                self.record_failures(posts_dir, output_path)
+                ImageQueue.for_posts_dir(posts_dir).remove(self.md_path)
+
+            return True
+        except Exception as e:
+            self.emit('error', 0, error=str(e))
+            return False
+        finally:
+            self.release_archive()
+
+    def publish_text(self, manifest, posts_dir, output_path, image_urls, entry):
+        """先写出保留原始图片链接的文章，图片加入下载队列，由 localize() 下载后再原子替换链接"""
+        header = self.build_front_matter()
+        with self.stage('write'):
+            self.write_post(output_path, {}, header=header)
+        search_url = (manifest.get(self.md_path) or {}).get('search_url')
+        if self.search_index:
+            with self.stage('search_index'):
+                search_url = self.update_search_index(posts_dir, output_path, header, search_url)
+
+        ImageQueue.for_posts_dir(posts_dir).update(self.md_path, {
+            'output': output_path.name,
+            'urls': image_urls,
+            'archive': str(self.archive.path) if self.archive else None,
+            'member': self.member,
+        })
+        # pending 的文章下次转换不会被跳过，文章也不算完整
+        manifest.update(self.md_path, dict(entry, search_url=search_url, pending=True))
+        self.emit('images_queued', 100, count=len(image_urls), output=output_path.name)
+        return True
+
+    def localize(self):
+        """下载队列中本文的图片（文中靠前的先开始），替换文章中的链接后出队；取消时保留未完成的图片"""
+        try:
+            self.acquire_archive()
+            posts_dir = self.posts_dir()
+            queue = ImageQueue.for_posts_dir(posts_dir)
+            entry = queue.get(self.md_path)
+            if not entry:
+                return True
+            posts_dir, target_folder, output_path = self.resolve_paths(Path(entry['output']).stem)
+            if not output_path.exists():
+                queue.remove(self.md_path)
+                self.emit('output_missing', 0, output=output_path.name)
+                return False
+
+            manifest = PostManifest.for_posts_dir(posts_dir)
+            previous = manifest.get(self.md_path) or {}
+            self.emit('localize', 0, count=len(entry['urls']), output=output_path.name)
+            with self.stage('download'):
+                url_map, image_entries = self.download_all(list(entry['urls']), target_folder,
+                                                           previous.get('images', {}))
+            if not self.cancelled.is_set():
+                self.finish_downloads()
+
+            # 与直接转换一致：先压缩已下载的图片，格式变化时替换为新文件名的链接。
+            # 取消时也压缩已下载的部分，这些链接不再留在队列中，之后不会再被处理
+            if self.optimize_options and url_map:
+                with self.stage('optimize'):
+                    url_map, image_entries = self.optimize_images(target_folder, url_map, image_entries)
+
+            # 只替换已下载的链接，文章其余内容（含 Front Matter）保持不变
+            if url_map:
+                with self.stage('write'):
+                    self.write_post(output_path, url_map, source_path=output_path, header='')
+
+            if self.cancelled.is_set():
+                # 未下载的图片（含本次失败的）都留在队列中，下次继续，不算作失败
+                remaining = [url for url in entry['urls'] if url not in url_map]
+                queue.update(self.md_path, dict(entry, urls=remaining))
+                self.failed_images = []
+                if previous:
+                    manifest.update(self.md_path, dict(previous, images=dict(previous.get('images', {}),
+                                                                             **image_entries)))
+                self.emit('cancelled', 0)
+                return False
+
+            if previous:
+                manifest.update(self.md_path, dict(previous, images=dict(previous.get('images', {}), **image_entries),
+                                                   failed=self.failed_images, pending=False))
+            self.record_failures(posts_dir, output_path)
+            queue.remove(self.md_path)
+            return True
+        except Exception as e:
+            self.emit('error', 0, error=str(e))
+            return False
+        finally:
+            self.release_archive()
+
+    def update_search_index(self, posts_dir, output_path, header, previous_url):
+        """把刚写出的文章加入本地搜索索引（批次结束时写回），返回文章链接；索引更新失败不影响转换结果"""
+        try:
+            index = SearchIndex.for_blog(posts_dir.parent.parent)
+            with open(output_path, 'r', encoding='utf-8') as f:
+                content = f.read()[len(header):]
+            url = index.post_url(output_path.stem, self.front_matter)
+            index.upsert({
+                'title': str(self.front_matter.get('title') or output_path.stem),
+                'url': url,
+                'content': content,
+                'categories': list(self.front_matter.get('categories') or []),
+                'tags': list(self.front_matter.get('tags') or []),
+            }, previous_url)
+        except Exception as e:
+            self.emit('search_index_failed', error=str(e))
+            return previous_url
+        self.emit('search_indexed', url=url)
+        return url
+
+    def retry_failed(self):
+        """只重新下载失败日志中记录的图片，并就地修正已写出的文章，不重新处理其他内容"""
+        try:
+            entry = FailedJournal.for_posts_dir(self.posts_dir()).get(self.md_path)
+            if not entry:
+                return True
+            # 图片文件夹与文章同名（压缩包中的同名文档输出时可能带有序号）
+            posts_dir, target_folder, output_path = self.resolve_paths(Path(entry['output']).stem)
+            if not output_path.exists():
+                self.failed_images.extend(entry['urls'])
+                self.emit('output_missing', 0, output=output_path.name)
+                return False
+
+            # 重新验证时新版本下载失败的图片已有本地文件，仍按清单中的校验头重新验证后替换；
+            # 传入全部清单条目，以便判断文件是否还被其他 URL 共用
+            manifest = PostManifest.for_posts_dir(posts_dir)
+            previous = manifest.get(self.md_path)
+            previous_images = (previous or {}).get('images', {})
+            self.emit('retry_failed', 0, count=len(entry['urls']), output=output_path.name)
+            with self.stage('download'):
+                url_map, image_entries = self.download_all(list(entry['urls']), target_folder, previous_images)
+            if self.cancelled.is_set():
+                self.emit('cancelled', 0)
+                return False
+            self.finish_downloads()
+
+            # 只替换本次成功下载的链接，文章其余内容（含 Front Matter）保持不变
+            if url_map:
+                self.write_post(output_path, url_map, source_path=output_path, header='')
+
+            if previous:
+                manifest.update(self.md_path, dict(previous, images=dict(previous.get('images', {}), **image_entries),
+                                                   failed=self.failed_images))
+            self.record_failures(posts_dir, output_path)
+            return True
+        except Exception as e:
+            self.emit('error', 0, error=str(e))
+            return False
+
+
+def retry_failed_posts(output_root, image_url_prefix, max_workers=8, cache=None, progress=None, run_report=None,
+                       shared_assets=False):
+    """对博客失败日志中的每篇文章执行“仅重试失败图片”，返回仍然失败的图片数"""
+    posts_dir = Path(output_root) / "source" / "_posts"
+    journal = FailedJournal.for_posts_dir(posts_dir)
+    remaining = 0
+    for source_path in list(journal.entries()):
+        converter = PostConverter(source_path, {}, output_root, image_url_prefix, max_workers, cache,
+                                  progress=progress, run_report=run_report, shared_assets=shared_assets)
+        converter.retry_failed()
+        remaining += len(converter.failed_images)
+    PostManifest.flush_all()
+    return remaining
+
+
+def localize_pending_posts(output_root, image_url_prefix, max_workers=8, cache=None, progress=None, run_report=None,
+                           shared_assets=False, cancelled=None, optimize_options=None, optimize_pool=None):
+    """按加入顺序处理博客的图片下载队列（含上次中断留下的文章），返回下载失败的图片数"""
+    posts_dir = Path(output_root) / "source" / "_posts"
+    queue = ImageQueue.for_posts_dir(posts_dir)
+    remaining = 0
+    for source_path, entry in list(queue.entries().items()):
+        if cancelled is not None and cancelled.is_set():
+            break
+        archive = None
+        if entry.get('archive'):
+            try:
+                archive = YuqueArchive.for_path(entry['archive'])
+            except OSError:
+                pass
+        # 压缩包已不存在时按虚拟路径处理，包内自带的图片会下载失败并记入失败日志
+        converter = PostConverter(entry['member'] if archive else source_path, {}, output_root, image_url_prefix,
+                                  max_workers, cache, progress=progress, run_report=run_report,
+                                  optimize_options=optimize_options, shared_assets=shared_assets, archive=archive,
+                                  optimize_pool=optimize_pool)
+        if cancelled is not None:
+            converter.cancelled = cancelled
+        converter.localize()
+        remaining += len(converter.failed_images)
+    PostManifest.flush_all()
+    return remaining
+
+
+class YuqueClient:
+    """语雀 OpenAPI 客户端：共享连接池，按主机自适应限制并发，429/5xx/超时时退避重试"""
+
+    def __init__(self, token, base_url=YUQUE_API_BASE, max_workers=8, max_retries=3):
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.base_url = base_url.rstrip('/') + '/'
+        self.max_workers = max(1, max_workers)
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        self.session.headers.update({'X-Auth-Token': token, 'User-Agent': 'yuque-to-hexo'})
+        adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.limiter = HostLimiter.for_url(self.base_url)
+
+    def close(self):
+        self.session.close()
+
+    def get(self, path, params=None):
+        """请求一个接口，返回 (data, meta)"""
+        import requests
+        url = urllib.parse.urljoin(self.base_url, path)
+        error = None
+        retry_after = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(max(backoff_delay(attempt), retry_after or 0))
+            self.limiter.acquire()
+            latency = status = None
+            failed = False
+            try:
+                start = time.perf_counter()
+                response = self.session.get(url, params=params,
+                                            timeout=(CONNECT_TIMEOUT, self.limiter.read_timeout()))
+                latency = time.perf_counter() - start
+                status = response.status_code
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            except (requests.ConnectionError, requests.Timeout) as e:
+                failed = True
+                error = e
+                continue
+            finally:
+                self.limiter.release(latency, status, retry_after, failed)
+            if status in RETRY_STATUS_CODES:
+                error = requests.HTTPError(f"HTTP {status} for {url}", response=response)
+                continue
+            response.raise_for_status()
+            payload = response.json()
+            return payload.get('data'), payload.get('meta')
+        raise error
+
+    def list_docs(self, namespace):
+        """分页列出知识库的全部文档；首页返回总数时并发请求其余分页"""
+        path = f"repos/{namespace}/docs"
+        docs, meta = self.get(path, {'offset': 0, 'limit': YUQUE_PAGE_SIZE})
+        docs = list(docs or [])
+        total = (meta or {}).get('total')
+        if total is None:
+            page = docs
+            while len(page) == YUQUE_PAGE_SIZE:
+                page, _ = self.get(path, {'offset': len(docs), 'limit': YUQUE_PAGE_SIZE})
+                page = list(page or [])
+                docs.extend(page)
+            return docs
+        offsets = range(YUQUE_PAGE_SIZE, total, YUQUE_PAGE_SIZE)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for page, _ in executor.map(lambda offset: self.get(path, {'offset': offset, 'limit': YUQUE_PAGE_SIZE}),
+                                        offsets):
+                docs.extend(page or [])
+        return docs
+
+    def get_doc(self, namespace, slug):
+        """获取文档详情（含 Markdown 正文 body）"""
+        data, _ = self.get(f"repos/{namespace}/docs/{slug}", {'raw': 1})
+        return data
+
+
+class YuqueSync:
+    """把语雀知识库同步到本地目录：按 updated_at 只下载有变化的文档正文，每篇保存为 <slug>.md，
+    标题和日期记录在同步状态中，供转换时生成 Front Matter"""
+
+    STATE_FILE = ".yuque-sync-state.json"
+
+    def __init__(self, client, namespace, sync_dir, progress=None, run_report=None):
+        self.client = client
+        self.namespace = namespace.strip('/')
+        self.directory = Path(sync_dir) / self.safe_name(self.namespace)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.state_path = self.directory / self.STATE_FILE
+        self.on_progress = progress
+        self.run_report = run_report
+        self.failed = []
+
+    def emit(self, event_type, percent=None, **fields):
+        """记录一条以知识库为 post 的结构化事件"""
+        emit_event(self.run_report, self.on_progress, self.namespace, event_type, percent, **fields)
+
+    def load_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_state(self, state):
+        tmp_path = self.state_path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    @staticmethod
+    def safe_name(name):
+        return re.sub(r'[\\/*?:"<>|]', '_', name)
+
+    def doc_path(self, slug):
+        return self.directory / f"{self.safe_name(slug)}.md"
+
+    def write_doc(self, detail):
+        """原子写入文档正文"""
+        path = self.doc_path(detail['slug'])
+        tmp_path = path.with_suffix('.md.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(detail.get('body') or '')
+        os.replace(tmp_path, path)
+        return path
+
+    def fetch_doc(self, slug):
+        """在线程池中获取并写入一篇文档，返回 (详情, 计时)；计时记录工作线程，使 trace 中每个线程一条时间线"""
+        start = time.perf_counter()
+        detail = self.client.get_doc(self.namespace, slug)
+        self.write_doc(detail)
+        return detail, {'thread': threading.get_ident(), 'ts': time.time(), 'duration': time.perf_counter() - start}
+
+    def sync(self):
+        """拉取有变化的文档，返回 [(本地 md 路径, 标题和日期)]，包含未变化但已在本地的文档（由清单跳过）"""
+        start = time.perf_counter()
+        docs = self.client.list_docs(self.namespace)
+        state = self.load_state()
+        changed = [doc for doc in docs
+                   if state.get(doc['slug'], {}).get('updated_at') != doc.get('updated_at')
+                   or not self.doc_path(doc['slug']).exists()]
+        self.emit('sync_listed', 0, namespace=self.namespace, total=len(docs), changed=len(changed),
+                  duration=time.perf_counter() - start)
+
+        finished = 0
+        with ThreadPoolExecutor(max_workers=self.client.max_workers) as executor:
+            futures = {executor.submit(self.fetch_doc, doc['slug']): doc for doc in changed}
+            for future in as_completed(futures):
+                doc = futures[future]
+                finished += 1
+                percent = int(finished / len(changed) * 100)
+                try:
+                    detail, timing = future.result()
+                except Exception as e:
+                    self.failed.append(doc['slug'])
+                    self.emit('doc_failed', percent, slug=doc['slug'], title=doc.get('title', doc['slug']),
+                              error=str(e))
+                    continue
+                created_at = detail.get('created_at') or doc.get('created_at') or ''
+                state[doc['slug']] = {
+                    'updated_at': detail.get('updated_at') or doc.get('updated_at'),
+                    'title': detail.get('title') or doc.get('title') or doc['slug'],
+                    'date': created_at[:10] or time.strftime('%Y-%m-%d'),
+                }
+                self.emit('doc_fetched', percent, slug=doc['slug'], title=state[doc['slug']]['title'],
+                          file=self.doc_path(doc['slug']).name, **timing)
+        self.save_state(state)
+
+        synced = []
+        for doc in docs:
+            entry = state.get(doc['slug'])
+            if entry and self.doc_path(doc['slug']).exists():
+                synced.append((self.doc_path(doc['slug']), {'title': entry['title'], 'date': entry['date']}))
+        return synced
\ No newline at end of file
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""联网相关的实现：带建连计时的 urllib3 连接池、requests 适配器和响应体读取。
+requests / urllib3 加载较慢，yuque_core 在第一次联网时才导入本模块，图形界面启动和纯本地操作不会加载它们"""
+import time
+import socket
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ProtocolError, ReadTimeoutError, DecodeError, SSLError
+
+
+# 当前线程最近一次建立连接的耗时（DNS 解析、TCP/TLS 握手）
+_connection_timing = threading.local()
+
+
+def take_connection_timing():
+    """取出并清零当前线程记录的建连耗时；复用连接时均为 0"""
+    timing = {'dns': getattr(_connection_timing, 'dns', 0.0), 'connect': getattr(_connection_timing, 'connect', 0.0)}
+    _connection_timing.dns = _connection_timing.connect = 0.0
+    return timing
+
+
+class TimedConnectionMixin:
+    """在建立新连接时分别记录 DNS 解析和 TCP/TLS 握手耗时"""
+
+    def connect(self):
+        host = getattr(self, '_dns_host', None) or self.host
+        start = time.perf_counter()
+        try:
+            socket.getaddrinfo(host, self.port, 0, socket.SOCK_STREAM)
+        except OSError:
+            pass  # 交给真正的连接过程报告错误
+        resolved = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            # 连接阶段会再次解析主机名，此时通常命中系统解析缓存
+            _connection_timing.dns = getattr(_connection_timing, 'dns', 0.0) + resolved - start
+            _connection_timing.connect = getattr(_connection_timing, 'connect', 0.0) + time.perf_counter() - resolved
+
+
+class TimedHTTPConnection(TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """使用带耗时记录的连接池"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimedHTTPConnectionPool,
+            'https': TimedHTTPSConnectionPool,
+        }
+
+
+def read_into(raw, buffer):
+    """从 urllib3 响应读取到缓冲区，读取错误转换为与 iter_content 相同的 requests 异常"""
+    try:
+        return raw.readinto(buffer)
+    except ReadTimeoutError as e:
+        raise requests.ConnectionError(e)
+    except (ProtocolError, DecodeError, SSLError) as e:
+        raise requests.exceptions.ChunkedEncodingError(e)